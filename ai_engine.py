@@ -1,36 +1,353 @@
-import requests
-import google.generativeai as genai
+import hashlib
+import json
+import os
+import queue
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from chess_logic import ChessGame, move_coords, move_promotion, move_to_uci
+from endgame_tables import EndgameTables, describe
+from engine_client import EngineClient, CircuitBreaker, CHESS_API_URL
+from local_engine import get_local_move
+from metrics import REGISTRY, ERRORS, STAGE_SECONDS, Counter, timed, cache_collector
+from opening_book import OpeningBook
+from position_cache import PositionCache, ComputeAborted, normalize_fen
+
+# Engine backend: 'remote' asks chess-api.com, 'local' runs the in-process search
+ENGINE_MODE = os.environ.get('CHESS_ENGINE', 'remote')
+# What to do when the remote engine fails or its circuit breaker is open: 'local' or 'none'
+ENGINE_FALLBACK = os.environ.get('ENGINE_FALLBACK', 'local')
+
+engine_client = EngineClient(
+    url=os.environ.get('ENGINE_API_URL', CHESS_API_URL),
+    timeout=float(os.environ.get('ENGINE_TIMEOUT', '5')),
+    retries=int(os.environ.get('ENGINE_RETRIES', '2')),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.environ.get('ENGINE_BREAKER_FAILURES', '5')),
+        reset_timeout=float(os.environ.get('ENGINE_BREAKER_RESET', '30'))
+    )
+)
+
+# Engine results keyed by position, shared by every game and request
+engine_cache = PositionCache(
+    max_entries=int(os.environ.get('ENGINE_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('ENGINE_CACHE_TTL', '86400')),
+    path=os.environ.get('ENGINE_CACHE_PATH')
+)
+
+# Gemini commentary keyed by (position, move, engine summary), persisted so openings are reused across restarts
+commentary_cache = PositionCache(
+    max_entries=int(os.environ.get('COMMENTARY_CACHE_SIZE', '5000')),
+    path=os.environ.get('COMMENTARY_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'chess_gpt_commentary.db')),
+    max_disk_entries=int(os.environ.get('COMMENTARY_CACHE_DISK_SIZE', '100000'))
+)
+
+AI_MOVES = Counter('chess_gpt_ai_moves_total', 'AI moves by where they came from.', ['source'])
+REGISTRY.register_collector(cache_collector({'engine': engine_cache, 'commentary': commentary_cache}))
+REGISTRY.register_collector(lambda: [(
+    'chess_gpt_engine_breaker_state', 'gauge', 'Current state of the engine API circuit breaker.',
+    [({'state': state}, int(engine_client.breaker.state == state)) for state in ('closed', 'half-open', 'open')]
+)])
+
+# Optional Polyglot-layout opening book (built with build_book.py) consulted before the engine cache and any search
+OPENING_BOOK = os.environ.get('OPENING_BOOK')
+_opening_book = None
+_opening_book_lock = threading.Lock()
+
+# Optional directory of endgame tables (see build_bitbases.py) consulted before the opening book and any search
+ENDGAME_TABLES = os.environ.get('ENDGAME_TABLES')
+_endgame_tables = None
+_endgame_tables_lock = threading.Lock()
+
+# Gemini model name and, for local stand-ins such as fake_services.py, an alternative REST endpoint
+GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-2.0-flash')
+GEMINI_API_ENDPOINT = os.environ.get('GEMINI_API_ENDPOINT')
+
+def create_model(api_key):
+    """Configure the Gemini client and build the commentary model."""
+    # Importing the client library takes most of a cold start, so it waits until a model is needed
+    import google.generativeai as genai
+    if GEMINI_API_ENDPOINT:
+        genai.configure(api_key=api_key, transport='rest', client_options={'api_endpoint': GEMINI_API_ENDPOINT})
+    else:
+        genai.configure(api_key=api_key)
+    return genai.GenerativeModel(GEMINI_MODEL)
+
+class LazyModel:
+    """Stands in for the Gemini model and creates it on the first generate_content call."""
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self._model = None
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, **kwargs):
+        return self._get_model().generate_content(prompt, **kwargs)
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    if not self.api_key:
+                        raise ValueError("Missing GEMINI_API_KEY environment variable")
+                    self._model = create_model(self.api_key)
+        return self._model
 
 def get_ai_move(fen):
-    """Get the best move from the chess API."""
+    """Get the best move for a position, from the endgame tables, opening book or engine cache when possible."""
+    with timed('get_ai_move'):
+        result = get_endgame_move(fen)
+        if result is not None:
+            AI_MOVES.inc(source='endgame')
+            return result
+        result = get_book_move(fen)
+        if result is not None:
+            AI_MOVES.inc(source='book')
+            return result
+        source = 'engine'
+        result = engine_cache.get_or_compute(_engine_key(fen), lambda: _search_move(fen))
+        if result is None:
+            # The search this call joined may have failed for a reason that has passed; try once more
+            result = engine_cache.get_or_compute(_engine_key(fen), lambda: _search_move(fen))
+        if result is None and ENGINE_MODE == 'remote' and ENGINE_FALLBACK == 'local':
+            # Fallback results are deliberately left out of the cache
+            source = 'fallback'
+            result = get_local_move(fen)
+    AI_MOVES.inc(source=source if result is not None else 'none')
+    if result is None:
+        return None
+    # Hand out a copy so callers never mutate the cached entry (coordinates come back from JSON as a list)
+    return dict(result, coordinates=tuple(result['coordinates']))
+
+def precompute_ai_move(fen, stop=None):
+    """Search a position ahead of time so a later get_ai_move finds it cached; None for table and book positions.
+
+    Setting the optional stop event abandons a local search, which then leaves nothing in the cache.
+    """
+    if get_endgame_move(fen) is not None or get_book_move(fen) is not None:
+        return None
+
+    def search():
+        result = _search_move(fen, stop)
+        if stop is not None and stop.is_set():
+            # Requests waiting on this position search it themselves instead of sharing our None
+            raise ComputeAborted
+        return result
+
     try:
-        response = requests.post('https://chess-api.com/v1', 
-            json={
-                'fen': fen,
-                'depth': 12,
-                'variants': 1
-            }
-        )
-        data = response.json()
-        if 'move' in data:
-            move = data['move']
-            from_col = ord(move[0]) - ord('a')
-            from_row = 8 - int(move[1])
-            to_col = ord(move[2]) - ord('a')
-            to_row = 8 - int(move[3])
-
-            return {
-                'text': data.get('text', 'No description available'),
-                'win_chance': data.get('winChance', None),
-                'mate': data.get('mate', None),
-                'coordinates': (from_row, from_col, to_row, to_col)
-            }
-    except Exception as e:
-        print(f"Error getting AI move: {e}")
-    return None
+        result = engine_cache.get_or_compute(_engine_key(fen), search)
+    except ComputeAborted:
+        return None
+    return None if result is None else dict(result, coordinates=tuple(result['coordinates']))
+
+def _engine_key(fen):
+    return f"{ENGINE_MODE}:{normalize_fen(fen)}"
+
+def get_endgame_move(fen):
+    """Play the exact endgame table move, or None when no table covers the position."""
+    tables = _get_endgame_tables()
+    if tables is None:
+        return None
+    game = ChessGame()
+    try:
+        game.load_fen(fen)
+    except ValueError:
+        return None
+    found = tables.best_move(game)
+    if found is None:
+        return None
+    move, result, plies = found
+    # The expected reply is the table move of the position after ours
+    game._apply_move(move)
+    reply = tables.best_move(game)
+    # Report from white's point of view like chess-api.com
+    white_wins = (result == 'win') == (game.current_turn == 'black')
+    return {
+        'text': f"Endgame table move {move_to_uci(move)}: {describe(result, plies)}.",
+        'win_chance': 50.0 if result == 'draw' else 100.0 if white_wins else 0.0,
+        'mate': None if result == 'draw' else (plies + 1) // 2 * (1 if white_wins else -1),
+        'coordinates': move_coords(move),
+        'promotion': move_promotion(move),
+        'ponder': move_to_uci(reply[0]) if reply else None
+    }
+
+def adjudicate_endgame(game):
+    """End a game the endgame tables prove drawn; returns whether the game is over."""
+    tables = _get_endgame_tables()
+    if not game.game_over and tables is not None and (tables.probe(game) or (None,))[0] == 'draw':
+        game.game_over, game.result, game.winner = True, 'endgame tables', None
+    return game.game_over
+
+def _get_endgame_tables():
+    """Open the configured tables on first use; a missing or unreadable directory disables them."""
+    global _endgame_tables, ENDGAME_TABLES
+    if _endgame_tables is None and ENDGAME_TABLES:
+        with _endgame_tables_lock:
+            if _endgame_tables is None and ENDGAME_TABLES:
+                try:
+                    tables = EndgameTables(ENDGAME_TABLES)
+                    if not tables:
+                        raise OSError(f"no endgame tables in {ENDGAME_TABLES}")
+                    _endgame_tables = tables
+                except (OSError, ValueError) as e:
+                    ERRORS.inc(component='endgame_tables')
+                    print(f"Error opening endgame tables {ENDGAME_TABLES}: {e}")
+                    ENDGAME_TABLES = None
+    return _endgame_tables
+
+def get_book_move(fen):
+    """Pick a weighted random move from the opening book, or None when the position is out of book."""
+    book = _get_opening_book()
+    if book is None:
+        return None
+    game = ChessGame()
+    try:
+        game.load_fen(fen)
+    except ValueError:
+        return None
+    move = book.choose(game)
+    if move is None:
+        return None
+    return {
+        'text': f"Opening book move {move_to_uci(move)}",
+        'win_chance': None,
+        'mate': None,
+        'coordinates': move_coords(move),
+        'promotion': move_promotion(move)
+    }
+
+def _get_opening_book():
+    """Open the configured book on first use; a missing or unreadable file disables the book."""
+    global _opening_book, OPENING_BOOK
+    if _opening_book is None and OPENING_BOOK:
+        with _opening_book_lock:
+            if _opening_book is None and OPENING_BOOK:
+                try:
+                    _opening_book = OpeningBook(OPENING_BOOK)
+                except OSError as e:
+                    ERRORS.inc(component='opening_book')
+                    print(f"Error opening book {OPENING_BOOK}: {e}")
+                    OPENING_BOOK = None
+    return _opening_book
+
+def _search_move(fen, stop=None):
+    """Get the best move from the configured chess engine."""
+    if ENGINE_MODE == 'local':
+        return get_local_move(fen, stop=stop)
+    return engine_client.get_move(fen)
 
 def analyze_move(model, board, from_row, from_col, to_row, to_col, is_capture, is_check, engine_analysis=None):
     """Analyze a move using Gemini AI."""
+    key, prompt = _analysis_prompt(board, from_row, from_col, to_row, to_col, is_capture, is_check, engine_analysis)
+    
+    # Reuse earlier commentary for the same position, move and engine verdict
+    with timed('analyze_move'):
+        analysis = commentary_cache.get_or_compute(key, lambda: _generate_analysis(model, prompt))
+    return analysis or "Move analysis unavailable."
+
+def stream_move_analysis(model, **move_request):
+    """Yield a move's commentary in pieces as Gemini generates it; cached commentary comes as a single piece."""
+    key, prompt = _analysis_prompt(**move_request)
+    cached = commentary_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    
+    parts = []
+    complete = False
+    start = time.perf_counter()
+    try:
+        with timed('gemini_stream'):
+            for chunk in model.generate_content(prompt, stream=True):
+                text = chunk.text
+                if not text:
+                    continue
+                if not parts:
+                    STAGE_SECONDS.observe(time.perf_counter() - start, stage='gemini_first_token')
+                parts.append(text)
+                yield text
+        complete = True
+    except Exception as e:
+        ERRORS.inc(component='gemini')
+        print(f"Error streaming move analysis: {e}")
+    
+    # Only complete commentary is worth reusing
+    if complete and parts:
+        commentary_cache.put(key, ''.join(parts))
+    elif not parts:
+        yield "Move analysis unavailable."
+
+def _analysis_prompt(board, from_row, from_col, to_row, to_col, is_capture, is_check, engine_analysis=None):
+    """Build the single-move analysis prompt; returns (commentary cache key, prompt)."""
+    move, details = _describe_move(board, from_row, from_col, to_row, to_col, is_capture, is_check, engine_analysis)
+    
+    # Build the move analysis prompt
+    prompt = f"""
+    As a chess expert, analyze this move:
+    {details}
+    
+    Consider:
+    1. Strategic value
+    2. Position control
+    3. Piece development
+    4. Potential threats or opportunities
+    
+    Provide a brief, focused analysis (2-3 sentences) with concrete tactical or positional advantages.
+    """
+    return _commentary_key(board, move, engine_analysis), prompt
+
+def analyze_moves(model, move_requests):
+    """Analyze several moves with a single Gemini request.
+    
+    Each request is a dict of analyze_move's keyword arguments (without the model). Returns one
+    commentary string per request, in order.
+    """
+    if len(move_requests) == 1:
+        return [analyze_move(model, **move_requests[0])]
+    with timed('analyze_moves'):
+        return _analyze_moves(model, move_requests)
+
+def _analyze_moves(model, move_requests):
+    results = [None] * len(move_requests)
+    pending = []
+    for index, move_request in enumerate(move_requests):
+        move, details = _describe_move(**move_request)
+        key = _commentary_key(move_request['board'], move, move_request.get('engine_analysis'))
+        results[index] = commentary_cache.get(key)
+        if results[index] is None:
+            pending.append((index, key, details))
+    
+    if len(pending) == 1:
+        index, key, details = pending[0]
+        results[index] = analyze_move(model, **move_requests[index])
+    elif pending:
+        sections = "\n".join(f"    Move {number}:\n    {details}"
+                              for number, (_, _, details) in enumerate(pending, 1))
+        prompt = f"""
+    As a chess expert, analyze each of the following {len(pending)} moves independently.
+{sections}
+    
+    For each move consider:
+    1. Strategic value
+    2. Position control
+    3. Piece development
+    4. Potential threats or opportunities
+    
+    Provide a brief, focused analysis (2-3 sentences) per move with concrete tactical or positional advantages.
+    Reply with only a JSON array of {len(pending)} strings, the analysis of Move 1 first.
+    """
+        texts = _parse_batch_analysis(_generate_analysis(model, prompt), len(pending))
+        for (index, key, _), text in zip(pending, texts):
+            if text:
+                commentary_cache.put(key, text)
+                results[index] = text
+    
+    return [result or "Move analysis unavailable." for result in results]
+
+def _describe_move(board, from_row, from_col, to_row, to_col, is_capture, is_check, engine_analysis=None):
+    """Build the per-move part of an analysis prompt; returns (move, description) with move like 'e2e4'."""
     # Get coordinates and piece information
     files, ranks = 'abcdefgh', '87654321'
     from_square = f"{files[from_col]}{ranks[from_row]}"
@@ -42,30 +359,96 @@ def analyze_move(model, board, from_row, from_col, to_row, to_col, is_capture, i
     piece_color = get_piece_color(piece) if piece != ' ' else ('white' if from_row == 7 else 'black')
     is_castling = piece_type == 'king' and abs(ord(from_square[0]) - ord(to_square[0])) == 2
     
-    # Build the move analysis prompt
-    prompt = f"""
-    As a chess expert, analyze this move:
-    {_get_move_description(piece_color, piece_type, from_square, to_square, is_castling, is_capture, is_check, board, to_row, to_col)}
+    description = f"""{_get_move_description(piece_color, piece_type, from_square, to_square, is_castling, is_capture, is_check, board, to_row, to_col)}
     {_format_engine_info(engine_analysis)}
     
-    {_format_board(board)}
+    {_format_board(board)}"""
+    return from_square + to_square, description
+
+def _parse_batch_analysis(text, count):
+    """Split a batched Gemini reply into per-move commentary (None for any move that cannot be recovered)."""
+    if not text:
+        return [None] * count
     
-    Consider:
-    1. Strategic value
-    2. Position control
-    3. Piece development
-    4. Potential threats or opportunities
+    # Preferred format: a JSON array, possibly wrapped in a markdown code fence
+    body = re.sub(r'^```(?:json)?\s*|\s*```$', '', text.strip())
+    try:
+        data = json.loads(body)
+        if isinstance(data, list) and len(data) == count:
+            return [item if isinstance(item, str) else (item or {}).get('analysis') for item in data]
+    except (ValueError, AttributeError):
+        pass
     
-    Provide a brief, focused analysis (2-3 sentences) with concrete tactical or positional advantages.
-    """
+    # Fallback: free text with "Move N:" headings
+    parts = re.split(r'(?im)^[^\w\n]*move\s+(\d+)[^\w\n]*', text)
+    results = [None] * count
+    for number, section in zip(parts[1::2], parts[2::2]):
+        if 1 <= int(number) <= count and section.strip():
+            results[int(number) - 1] = section.strip()
+    return results
+
+class AnalysisBatcher:
+    """Queue analysis requests from concurrent sessions and send them to Gemini in shared batches."""
     
-    # Get response from model
+    def __init__(self, model, max_batch=8, max_wait=0.05, workers=4):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        threading.Thread(target=self._collect, daemon=True).start()
+    
+    def submit(self, move_request):
+        """Queue one move for analysis and return a Future of its commentary."""
+        future = Future()
+        self._queue.put((move_request, future))
+        return future
+    
+    def _collect(self):
+        # Wait for a first request, then gather more for up to max_wait seconds
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._send, batch)
+    
+    def _send(self, batch):
+        try:
+            results = analyze_moves(self.model, [move_request for move_request, _ in batch])
+        except Exception as e:
+            ERRORS.inc(component='analysis_batch')
+            print(f"Error getting batched move analysis: {e}")
+            results = ["Move analysis unavailable."] * len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+def _generate_analysis(model, prompt):
+    """Get a response from the model, or None if the call fails."""
     try:
-        response = model.generate_content(prompt)
+        with timed('gemini'):
+            response = model.generate_content(prompt)
         return response.text
     except Exception as e:
+        ERRORS.inc(component='gemini')
         print(f"Error getting move analysis: {e}")
-        return "Move analysis unavailable."
+        return None
+
+def _commentary_key(board, move, engine_analysis):
+    """Hash the position, the move and a coarse engine summary into a commentary cache key."""
+    position = ''.join(''.join(row) for row in board)
+    summary = ''
+    if engine_analysis:
+        # The free-text description carries node counts and depths, so only the verdict goes into the key
+        win_chance = engine_analysis.get('win_chance')
+        summary = f"{round(win_chance) if win_chance is not None else ''}|{engine_analysis.get('mate')}"
+    return hashlib.blake2b(f"{position}|{move}|{summary}".encode(), digest_size=16).hexdigest()
 
 def _get_move_description(color, type, from_sq, to_sq, is_castling, is_capture, is_check, board, to_row, to_col):
     """Create a descriptive string of the move for analysis."""
@@ -0,0 +1,266 @@
+"""Annotate PGN archives offline with engine evaluations and Gemini commentary.
+
+Games are streamed from the input, replayed on ChessGame, evaluated on a process pool and written
+out one game at a time, so memory stays bounded however large the archive is. With --screen, every
+position of a game is first scored by the batch static evaluator, and only the moves that swing it
+get engine evaluations and commentary.
+
+Usage: python analyze_pgn.py games.pgn [-o annotated.pgn | -o annotated.jsonl] [--workers 4]
+       [--no-commentary] [--commentary-rate 1.0] [--max-games N] [--screen 150]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from chess_logic import ChessGame, START_FEN, EN_PASSANT, move_coords, move_to_uci
+from pgn import read_games, san_to_move
+
+# Positions evaluated ahead of the writer; bounds memory together with the size of one game
+DEFAULT_WINDOW = 256
+# Moves per Gemini request when commenting a game
+COMMENTARY_BATCH = 8
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` calls per second with bursts of up to `burst` calls."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call is allowed."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimitedModel:
+    """Wrap a Gemini model so every generate_content call goes through a rate limiter.
+
+    Cached commentary never reaches the model, so it does not use up the budget.
+    """
+
+    def __init__(self, model, limiter):
+        self.model = model
+        self.limiter = limiter
+
+    def generate_content(self, prompt, **kwargs):
+        self.limiter.acquire()
+        return self.model.generate_content(prompt, **kwargs)
+
+
+def replay_game(headers, san_moves):
+    """Replay a game and describe each move; stops at the first unreadable move."""
+    moves = []
+    try:
+        game = ChessGame.from_fen(headers.get('FEN', START_FEN))
+        for san in san_moves:
+            move = san_to_move(game, san)
+            from_row, from_col, to_row, to_col = move_coords(move)
+            board = game.board
+            is_capture = board[to_row][to_col] != ' ' or bool(move & EN_PASSANT)
+            game._apply_move(move)
+            moves.append({
+                'san': san,
+                'uci': move_to_uci(move),
+                'fen': game.to_fen(),
+                'position': game.encode_board(),
+                'analysis_request': {
+                    'board': board, 'from_row': from_row, 'from_col': from_col, 'to_row': to_row,
+                    'to_col': to_col, 'is_capture': is_capture, 'is_check': game._is_in_check(game.current_turn)
+                }
+            })
+    except ValueError as e:
+        # A bad setup FEN or an illegal move ends the game here; the moves so far are still annotated
+        print(f"Stopping game '{headers.get('White', '?')} - {headers.get('Black', '?')}' early: {e}", file=sys.stderr)
+    return moves
+
+
+def evaluate_position(fen):
+    """Engine evaluation of the position after a move (runs in a worker process)."""
+    from ai_engine import get_ai_move
+    try:
+        return get_ai_move(fen)
+    except Exception as e:
+        print(f"Error evaluating {fen}: {e}", file=sys.stderr)
+        return None
+
+
+def screen_moves(headers, moves, threshold):
+    """Score every position of a game in one batch and mark the moves that swing the static evaluation.
+
+    Each move gets 'static_eval' (centipawns, white's point of view) and 'critical', which is set when
+    the evaluation moved by at least threshold centipawns.
+    """
+    from batch_eval import evaluate_batch
+    if not moves:
+        return
+    start = ChessGame.from_fen(headers.get('FEN', START_FEN)).encode_board()
+    scores = evaluate_batch([start] + [move['position'] for move in moves]).tolist()
+    for move, before, after in zip(moves, scores, scores[1:]):
+        move['static_eval'] = after
+        move['critical'] = abs(after - before) >= threshold
+
+
+def evaluate_games(games, executor, window=DEFAULT_WINDOW, screen=None):
+    """Yield (headers, moves) with an 'engine' entry per move, keeping at most `window` positions in flight.
+
+    With a screen threshold, only the moves screen_moves marks critical are sent to the engine.
+    """
+    pending = deque()
+    in_flight = 0
+    for headers, san_moves in games:
+        moves = replay_game(headers, san_moves)
+        if screen is not None:
+            screen_moves(headers, moves, screen)
+        futures = [executor.submit(evaluate_position, move['fen']) if move.get('critical', True) else None
+                   for move in moves]
+        pending.append((headers, moves, futures))
+        in_flight += _submitted(futures)
+        # Hand games on in input order once enough work is queued
+        while pending and in_flight > window:
+            in_flight -= _submitted(pending[0][2])
+            yield _collect(*pending.popleft())
+    while pending:
+        yield _collect(*pending.popleft())
+
+
+def _submitted(futures):
+    return sum(future is not None for future in futures)
+
+
+def _collect(headers, moves, futures):
+    for move, future in zip(moves, futures):
+        move['engine'] = future.result() if future is not None else None
+    return headers, moves
+
+
+def add_commentary(games, model, workers=2, batch=COMMENTARY_BATCH):
+    """Yield games with Gemini commentary added to every move not screened out, several moves per request."""
+    from ai_engine import analyze_moves
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for headers, moves in games:
+            selected = [move for move in moves if move.get('critical', True)]
+            requests = [dict(move['analysis_request'], engine_analysis=move['engine']) for move in selected]
+            chunks = [requests[start:start + batch] for start in range(0, len(requests), batch)]
+            comments = [text for texts in pool.map(lambda chunk: analyze_moves(model, chunk), chunks) for text in texts]
+            for move, comment in zip(selected, comments):
+                move['commentary'] = comment
+            yield headers, moves
+
+
+def _engine_comment(engine):
+    if not engine:
+        return ''
+    if engine.get('mate'):
+        # Mate scores are signed from white's point of view, like the win chance
+        verdict = f"{'white' if engine['mate'] > 0 else 'black'} mates in {abs(engine['mate'])}"
+    elif engine.get('win_chance') is not None:
+        verdict = f"white win chance {engine['win_chance']:.1f}%"
+    else:
+        verdict = engine.get('text', '')
+    row, col, to_row, to_col = engine['coordinates']
+    best = f"{'abcdefgh'[col]}{8 - row}{'abcdefgh'[to_col]}{8 - to_row}"
+    return f"{verdict}; best reply {best}"
+
+
+def format_pgn(headers, moves):
+    """Render a game as PGN with the engine verdict and commentary as move comments."""
+    lines = [f'[{name} "{value}"]' for name, value in headers.items()]
+    tokens = []
+    # Number moves from the FEN's side to move and fullmove number when the game has a setup position
+    fields = headers.get('FEN', '').split()
+    offset = 1 if fields[1:2] == ['b'] else 0
+    first = int(fields[5]) if len(fields) == 6 and fields[5].isdigit() else 1
+    for ply, move in enumerate(moves):
+        number, black = divmod(ply + offset, 2)
+        if not black:
+            tokens.append(f"{first + number}.")
+        elif ply == 0:
+            tokens.append(f"{first + number}...")
+        tokens.append(move['san'])
+        comment = ' '.join(part for part in (_engine_comment(move.get('engine')), move.get('commentary')) if part)
+        if comment:
+            tokens.append('{' + comment.replace('{', '(').replace('}', ')') + '}')
+    tokens.append(headers.get('Result', '*'))
+    return '\n'.join(lines) + '\n\n' + ' '.join(tokens) + '\n\n'
+
+
+def format_jsonl(headers, moves):
+    """Render a game as one JSON line."""
+    return json.dumps({
+        'headers': headers,
+        'moves': [{key: value for key, value in move.items() if key not in ('analysis_request', 'position')}
+                  for move in moves]
+    }) + '\n'
+
+
+def _limit(games, max_games):
+    for index, game in enumerate(games):
+        if max_games is not None and index >= max_games:
+            return
+        yield game
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Annotate PGN games with engine evaluations and Gemini commentary.')
+    parser.add_argument('pgn', help="PGN file to read ('-' for stdin)")
+    parser.add_argument('-o', '--output', default='-', help="output file, .pgn or .jsonl ('-' for stdout)")
+    parser.add_argument('--format', choices=('pgn', 'jsonl'), help='output format (default: from the file name)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='engine evaluation processes')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help='positions evaluated ahead of the output')
+    parser.add_argument('--no-commentary', action='store_true', help='skip Gemini commentary')
+    parser.add_argument('--commentary-rate', type=float, default=1.0, help='Gemini requests per second')
+    parser.add_argument('--max-games', type=int, help='stop after this many games')
+    parser.add_argument('--screen', type=int, metavar='CENTIPAWNS',
+                        help='only evaluate and comment moves that change the static evaluation by this much')
+    args = parser.parse_args()
+
+    output_format = args.format or ('jsonl' if args.output.endswith('.jsonl') else 'pgn')
+    formatter = format_jsonl if output_format == 'jsonl' else format_pgn
+    commentary = not args.no_commentary
+    if commentary and not os.environ.get('GEMINI_API_KEY'):
+        print("GEMINI_API_KEY is not set; writing engine annotations only", file=sys.stderr)
+        commentary = False
+
+    source = sys.stdin if args.pgn == '-' else open(args.pgn, encoding='utf-8', errors='replace')
+    sink = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    count = 0
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            games = evaluate_games(_limit(read_games(source), args.max_games), executor, args.window, args.screen)
+            if commentary:
+                from ai_engine import create_model
+                model = RateLimitedModel(create_model(os.environ['GEMINI_API_KEY']), RateLimiter(args.commentary_rate))
+                games = add_commentary(games, model)
+            for headers, moves in games:
+                sink.write(formatter(headers, moves))
+                sink.flush()
+                count += 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    print(f"Annotated {count} games in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,51 +1,184 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request, make_response, url_for
+import json
 import os
-import google.generativeai as genai
+import queue
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as StageTimeout
 from chess_logic import ChessGame
-from ai_engine import get_ai_move, analyze_move
+from ai_engine import (
+    get_ai_move, precompute_ai_move, adjudicate_endgame, analyze_move, analyze_moves, stream_move_analysis,
+    LazyModel, AnalysisBatcher
+)
+from game_store import create_game_store
+from local_engine import evaluate
+from metrics import REGISTRY, ERRORS, Counter, timed, track_future
+from ponder import Ponderer
 
 app = Flask(__name__)
 
-# Configure Gemini API
+# Configure Gemini API; the client is created on the first analysis, not on every cold start
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
 if not GEMINI_API_KEY:
-    raise ValueError("Missing GEMINI_API_KEY environment variable")
+    print("GEMINI_API_KEY is not set; move analysis will be unavailable")
 
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.0-flash')
+model = LazyModel(GEMINI_API_KEY)
 
-# Initialize game state
-game = ChessGame()
+# Worker pool and per-stage deadlines (seconds) for the /move pipeline
+executor = ThreadPoolExecutor(max_workers=int(os.environ.get('PIPELINE_WORKERS', '8')))
+ENGINE_STAGE_TIMEOUT = float(os.environ.get('ENGINE_STAGE_TIMEOUT', '20'))
+ANALYSIS_STAGE_TIMEOUT = float(os.environ.get('ANALYSIS_STAGE_TIMEOUT', '20'))
+
+# Gemini requests per turn: 'off' (one per move), 'turn' (both moves in one) or 'queue' (batched across sessions)
+ANALYSIS_BATCHING = os.environ.get('ANALYSIS_BATCHING', 'turn')
+analysis_batcher = AnalysisBatcher(model) if ANALYSIS_BATCHING == 'queue' else None
+
+# Reply to /move without commentary and stream it from /analysis_stream as Gemini writes it
+COMMENTARY_STREAMING = os.environ.get('COMMENTARY_STREAMING', '0') == '1'
+
+# Games are kept per browser session: 'memory' or 'sqlite:///games.db' (shared by all workers)
+store = create_game_store(
+    os.environ.get('GAME_STORE', 'memory'),
+    idle_timeout=float(os.environ.get('GAME_IDLE_TIMEOUT', '3600'))
+)
+GAME_COOKIE = 'game_id'
+
+# Search the AI's replies to the player's likeliest moves while the player thinks (and optionally their commentary)
+PONDER = os.environ.get('PONDER', '0') == '1'
+PONDER_COMMENTARY = os.environ.get('PONDER_COMMENTARY', '0') == '1'
+ponderer = Ponderer(
+    precompute_ai_move,
+    comment=(lambda move_requests: analyze_moves(model, move_requests)) if PONDER_COMMENTARY else None,
+    workers=int(os.environ.get('PONDER_WORKERS', '2')),
+    candidates=int(os.environ.get('PONDER_MOVES', '3'))
+) if PONDER else None
+
+# Add the per-stage timing breakdown (milliseconds) to every /move response, not just the log
+RESPONSE_TIMINGS = os.environ.get('RESPONSE_TIMINGS', '0') == '1'
+REQUESTS = Counter('chess_gpt_requests_total', 'HTTP requests by endpoint and status.', ['endpoint', 'status'])
+
+@app.after_request
+def count_request(response):
+    REQUESTS.inc(endpoint=request.endpoint or 'unknown', status=response.status_code)
+    return response
+
+def stage_result(future, timeout, default, stage):
+    """Wait for a pipeline stage, falling back to a default when it is too slow."""
+    try:
+        return future.result(timeout=timeout)
+    except StageTimeout:
+        future.cancel()
+        ERRORS.inc(component='stage_timeout')
+        print(f"Pipeline stage '{stage}' timed out after {timeout}s")
+        return default
+
+def submit_analyses(move_requests):
+    """Start the commentary for the moves of a turn and return one future per move."""
+    if analysis_batcher:
+        return [analysis_batcher.submit(move_request) for move_request in move_requests]
+    if ANALYSIS_BATCHING == 'turn' and len(move_requests) > 1:
+        batch = executor.submit(analyze_moves, model, move_requests)
+        return [batch_item(batch, index) for index in range(len(move_requests))]
+    return [executor.submit(analyze_move, model, **move_request) for move_request in move_requests]
+
+def batch_item(batch, index):
+    """Derive a future for one entry of a future list result."""
+    item = Future()
+    def copy_result(done):
+        if done.cancelled():
+            item.cancel()
+        elif done.exception():
+            item.set_exception(done.exception())
+        else:
+            item.set_result(done.result()[index])
+    batch.add_done_callback(copy_result)
+    return item
 
 @app.route('/')
 def home():
     return render_template('color_select.html')
 
+def load_game():
+    """Load the current session's game and its last-move record from the store."""
+    game_id = request.cookies.get(GAME_COOKIE)
+    state = store.get(game_id) if game_id else None
+    if state is None:
+        return game_id, None, None
+    return game_id, ChessGame.from_state(state), state.get('last_moves', [None, None])
+
+def save_game(game_id, game, last_moves):
+    store.put(game_id, dict(game.to_state(), last_moves=last_moves))
+
+def analysis_key(game_id):
+    """Store key of the commentary a streaming /move left for /analysis_stream."""
+    return f"{game_id}:analysis"
+
+def static_evaluation(game):
+    """Static evaluation in centipawns from white's point of view, for the evaluation bar."""
+    # One position is cheaper in pure Python than through NumPy, which would also slow the cold start
+    score = evaluate(game)
+    return score if game.current_turn == 'white' else -score
+
+def player_legal_moves(game):
+    """Legal from/to pairs the client may play right now, so it can reject illegal drops without a request."""
+    return game.legal_move_pairs() if game.is_player_turn else []
+
 @app.route('/select_color/<color>')
 def select_color(color):
-    # Initialize game with player's color choice
+    # Initialize a new game with player's color choice, dropping commentary still pending for the old one
+    previous_id = request.cookies.get(GAME_COOKIE)
+    if previous_id:
+        store.delete(analysis_key(previous_id))
+    game_id = uuid.uuid4().hex
+    game = ChessGame()
     game.player_color = color
-    game.board = game.create_initial_board()
+    game.create_initial_board()
     game.current_turn = 'white'
     game.is_player_turn = color == 'white'
     
     # If player is black, make AI's first move
+    ai_analysis = None
     if not game.is_player_turn:
         ai_analysis = get_ai_move(game.to_fen())
         if ai_analysis:
             game.make_move(*ai_analysis['coordinates'])
     
-    return render_template('index.html', 
+    save_game(game_id, game, [None, None])
+    if ponderer and game.is_player_turn:
+        ponderer.start(game_id, game.to_fen(), hint=(ai_analysis or {}).get('ponder'))
+    
+    response = make_response(render_template('index.html', 
                          title='Chess GPT',
                          message=f'You are playing as {color}',
                          board=game.board,
-                         player_color=color)
-
-last_moves = [None, None]
+                         version=game.version,
+                         legal_moves=player_legal_moves(game),
+                         evaluation=static_evaluation(game),
+                         player_color=color))
+    response.set_cookie(GAME_COOKIE, game_id, httponly=True, samesite='Lax')
+    return response
 
 @app.route('/move', methods=['POST'])
 def move():
+    game_id, game, last_moves = load_game()
+    if game is None:
+        return jsonify({
+            'valid': False,
+            'message': 'No active game found. Please start a new game.',
+            'reverting_move': True
+        })
     
+    timings = {}
+    try:
+        with timed('move_request', timings):
+            return play_move(game_id, game, last_moves, timings)
+    finally:
+        save_game(game_id, game, last_moves)
+        # Stages that timed out can still record their time from an executor thread, so read a copy
+        print(f"/move {game_id[:8]} timings: " +
+              ' '.join(f"{stage}={seconds * 1000:.2f}ms" for stage, seconds in dict(timings).items()))
+
+def play_move(game_id, game, last_moves, timings):
+    """Validate and apply the player's move, then reply with the AI's move and analyses."""
     if last_moves[1] != None:
         last_moves[0] = last_moves[1][:]
     
@@ -56,7 +189,7 @@ def move():
             'current_turn': game.current_turn,
             'game_over': True,
             'winner': game.winner,
-            'message': f'Game is over! {game.winner} has won!',
+            'message': f'Game is over! {game.winner} has won!' if game.winner else 'Game is over! It was a draw.',
             'reverting_move': False
         })
     
@@ -81,8 +214,17 @@ def move():
             'reverting_move': True
         })
     
+    promotion = data.get('promotion')
+    
+    # The client's board version decides between a delta and a full board in the reply
+    client_version = data.get('version')
+    version_before = game.version
+    squares_before = list(game.squares)
+    
     # Validate move
-    if not game.is_valid_move(from_row, from_col, to_row, to_col):
+    with timed('validation', timings):
+        is_valid = game.is_valid_move(from_row, from_col, to_row, to_col, promotion)
+    if not is_valid:
         return jsonify({
             'valid': False,
             'current_turn': game.current_turn,
@@ -90,77 +232,70 @@ def move():
             'reverting_move': False
         })
     
-    # Save the original piece information before the move
-    original_piece = game.board[from_row][from_col]
+    # Render the board before the move for analysis
+    board_before_move = game.board
     
     # Execute player's move
-    is_capture = game.board[to_row][to_col] != ' '
-    game.make_move(from_row, from_col, to_row, to_col)
+    is_capture = game.piece_at(to_row, to_col) != ' '
+    game.make_move(from_row, from_col, to_row, to_col, promotion)
+    game.update_game_status()
+    adjudicate_endgame(game)
     
     # Check if opponent is in check
     opponent_color = 'black' if game.player_color == 'white' else 'white'
-    is_check = game._is_in_check(opponent_color, game.board)
+    is_check = game._is_in_check(opponent_color)
     
-    # Get move analysis
+    # Stage 1: one engine call evaluates the player's move and doubles as the AI's reply
     fen = game.to_fen()
-    player_engine_analysis = get_ai_move(fen)
-    
-    # Create a temporary board with the original piece for analysis
-    temp_board = [row[:] for row in game.board]  # Deep copy the current board
-    temp_board[from_row][from_col] = original_piece  # Restore the original piece at the from position
-    temp_board[to_row][to_col] = ' '  # Clear the to position
-    
-    player_move_analysis = analyze_move(
-        model, temp_board, from_row, from_col, to_row, to_col,
-        is_capture, is_check, player_engine_analysis
+    if ponderer:
+        # A predicted move finds its reply cached or already being searched
+        ponderer.stop(game_id, game.zobrist_key())
+    player_engine_analysis = stage_result(
+        track_future(executor.submit(get_ai_move, fen), 'engine', timings), ENGINE_STAGE_TIMEOUT, None, 'engine'
     )
     
-    # Prepare response
+    # Stage 2 input: commentary for the player's move, plus the AI reply once it is known
+    analysis_requests = [dict(
+        board=board_before_move, from_row=from_row, from_col=from_col, to_row=to_row, to_col=to_col,
+        is_capture=is_capture, is_check=is_check, engine_analysis=player_engine_analysis
+    )]
+    
     response = {
         'valid': True,
-        'board': game.board,
-        'current_turn': game.current_turn,
-        'move_analysis': player_move_analysis,
-        'game_over': game.game_over,
-        'winner': game.winner,
-        'in_check': game._is_in_check(game.current_turn, game.board),
         'reverting_move': False
     }
     
     # Process AI's move if game is still ongoing
     ai_move_data = None
     if not game.game_over:
-        ai_analysis = get_ai_move(fen)
+        ai_analysis = player_engine_analysis
         if ai_analysis:
             # Extract AI move data
             ai_coords = ai_analysis['coordinates']
             ai_from_row, ai_from_col, ai_to_row, ai_to_col = ai_coords
             
             # Check if AI's move is a capture
-            ai_is_capture = game.board[ai_to_row][ai_to_col] != ' '
+            ai_is_capture = game.piece_at(ai_to_row, ai_to_col) != ' '
             
-            # Save the original AI piece information before the move
-            ai_original_piece = game.board[ai_from_row][ai_from_col]
+            # Render the board before the AI move for analysis
+            ai_board_before_move = game.board
             
             # Make AI's move
-            game.make_move(ai_from_row, ai_from_col, ai_to_row, ai_to_col)
+            game.make_move(ai_from_row, ai_from_col, ai_to_row, ai_to_col, ai_analysis.get('promotion'))
+            game.update_game_status()
+            adjudicate_endgame(game)
             
             # Check if player is in check
-            ai_is_check = game._is_in_check(game.player_color, game.board)
+            ai_is_check = game._is_in_check(game.player_color)
             
-            # Create a temporary board with the original AI piece for analysis
-            ai_temp_board = [row[:] for row in game.board]  # Deep copy the current board
-            ai_temp_board[ai_from_row][ai_from_col] = ai_original_piece  # Restore the original piece
-            ai_temp_board[ai_to_row][ai_to_col] = ' '  # Clear the destination
-            
-            # Get analysis for AI's move
-            response['ai_move_analysis'] = analyze_move(
-                model, ai_temp_board, ai_from_row, ai_from_col, ai_to_row, ai_to_col,
-                ai_is_capture, ai_is_check, ai_analysis
-            )
+            analysis_requests.append(dict(
+                board=ai_board_before_move, from_row=ai_from_row, from_col=ai_from_col,
+                to_row=ai_to_row, to_col=ai_to_col,
+                is_capture=ai_is_capture, is_check=ai_is_check, engine_analysis=ai_analysis
+            ))
             
             # Prepare AI move data for frontend
-            is_castling = abs(ai_to_col - ai_from_col) == 2 and game.board[ai_to_row][ai_to_col] in '♔♚'
+            is_castling = abs(ai_to_col - ai_from_col) == 2 and game.piece_at(ai_to_row, ai_to_col) in '♔♚'
             ai_move_data = {
                 'from_row': ai_from_row,
                 'from_col': ai_from_col,
@@ -177,26 +312,176 @@ def move():
                     'rook_to_col': ai_to_col + 1 if ai_to_col < ai_from_col else ai_to_col - 1
                 }
     
+    if COMMENTARY_STREAMING:
+        # Stage 2 runs when the client opens the stream; the board goes out now
+        store.put(analysis_key(game_id), {
+            'version': game.version,
+            'requests': [{'move': label, 'request': move_request}
+                         for label, move_request in zip(('player', 'ai'), analysis_requests)]
+        })
+        response['analysis_stream'] = url_for('analysis_stream', version=game.version)
+    else:
+        # Stage 2: commentary for the turn (batched per ANALYSIS_BATCHING), each bounded by its own deadline
+        analysis_futures = [
+            track_future(future, stage, timings)
+            for future, stage in zip(submit_analyses(analysis_requests), ('player_analysis', 'ai_analysis'))
+        ]
+        response['move_analysis'] = stage_result(
+            analysis_futures[0], ANALYSIS_STAGE_TIMEOUT, 'Move analysis unavailable.', 'player analysis'
+        )
+        if len(analysis_futures) > 1:
+            response['ai_move_analysis'] = stage_result(
+                analysis_futures[1], ANALYSIS_STAGE_TIMEOUT, 'Move analysis unavailable.', 'AI analysis'
+            )
+    
     # Update response with AI move and latest game state
     response.update({
         'ai_move': ai_move_data,
+        'version': game.version,
         'current_turn': game.current_turn,
         'game_over': game.game_over,
         'winner': game.winner,
-        'in_check': game._is_in_check(game.current_turn, game.board)
+        'result': game.result,
+        'in_check': game._is_in_check(game.current_turn),
+        'legal_moves': player_legal_moves(game),
+        'evaluation': static_evaluation(game)
     })
     
     # Add appropriate message
-    if game.game_over:
-        response['message'] = f'Game Over! {game.winner} wins!'
+    if game.game_over and game.winner:
+        response['message'] = f'Game Over! {game.winner} wins by {game.result}!'
+    elif game.game_over:
+        response['message'] = f'Game Over! Draw by {game.result}.'
     elif response['in_check']:
         response['message'] = f'{game.current_turn} is in check!'
     
-    return jsonify(response)
+    # Only the changed squares when the client was in sync, otherwise the whole board to resync it
+    if client_version == version_before:
+        response['changes'] = game.changed_squares(squares_before)
+    else:
+        response['board'] = game.board
+    
+    if ponderer and game.is_player_turn and not game.game_over:
+        ponderer.start(game_id, game.to_fen(), hint=(player_engine_analysis or {}).get('ponder'))
+    
+    if RESPONSE_TIMINGS:
+        response['timings'] = {stage: round(seconds * 1000, 2) for stage, seconds in dict(timings).items()}
+    with timed('serialization', timings):
+        return jsonify(response)
+
+@app.route('/takeback', methods=['POST'])
+def takeback():
+    """Take back the player's last move and the AI's reply to it."""
+    game_id, game, _ = load_game()
+    if game is None:
+        return jsonify({'message': 'No active game found. Please start a new game.'}), 404
+    
+    # The AI's opening move is not the player's to take back
+    if len(game.history) <= (game.player_color == 'black'):
+        return jsonify({'valid': False, 'message': 'There is no move to take back.'})
+    
+    taken_back = [game.undo_move()]
+    while not game.is_player_turn and game.history:
+        taken_back.append(game.undo_move())
+    save_game(game_id, game, [None, None])
+    store.delete(analysis_key(game_id))
+    if ponderer:
+        ponderer.start(game_id, game.to_fen())
+    
+    return jsonify({
+        'valid': True,
+        'taken_back': taken_back,
+        'board': game.board,
+        'version': game.version,
+        'current_turn': game.current_turn,
+        'in_check': game._is_in_check(game.current_turn),
+        'legal_moves': player_legal_moves(game),
+        'evaluation': static_evaluation(game),
+        'message': f"Took back {' '.join(reversed(taken_back))}"
+    })
+
+@app.route('/state')
+def game_state():
+    """Full game state for clients that lost track of the version; answers 304 while their ETag is current."""
+    game_id, game, _ = load_game()
+    if game is None:
+        return jsonify({'message': 'No active game found. Please start a new game.'}), 404
+    
+    response = jsonify({
+        'board': game.board,
+        'version': game.version,
+        'current_turn': game.current_turn,
+        'player_color': game.player_color,
+        'game_over': game.game_over,
+        'winner': game.winner,
+        'result': game.result,
+        'in_check': game._is_in_check(game.current_turn),
+        'legal_moves': player_legal_moves(game),
+        'evaluation': static_evaluation(game)
+    })
+    response.set_etag(f"{game_id}-{game.version}")
+    return response.make_conditional(request)
+
+@app.route('/legal_moves')
+def legal_moves():
+    """Every legal from/to pair for the player in the current position."""
+    game_id, game, _ = load_game()
+    if game is None:
+        return jsonify({'message': 'No active game found. Please start a new game.'}), 404
+    
+    response = jsonify({'version': game.version, 'legal_moves': player_legal_moves(game)})
+    response.set_etag(f"{game_id}-{game.version}-legal")
+    return response.make_conditional(request)
+
+@app.route('/analysis_stream')
+def analysis_stream():
+    """Stream the last turn's commentary as server-sent events: 'commentary' chunks, 'done' per move, then 'end'."""
+    game_id = request.cookies.get(GAME_COOKIE)
+    pending = store.get(analysis_key(game_id)) if game_id else None
+    if pending is None or pending['version'] != request.args.get('version', type=int):
+        return jsonify({'message': 'No commentary pending for this position.'}), 404
+    # Each turn's commentary streams once; a reconnecting client gets a 404 instead of a replay
+    store.delete(analysis_key(game_id))
+    
+    def produce(label, move_request, chunks):
+        try:
+            for text in stream_move_analysis(model, **move_request):
+                chunks.put((label, text))
+        finally:
+            chunks.put((label, None))
+    
+    def events():
+        # Both moves stream at once; their chunks are interleaved and tagged with the move they belong to
+        chunks = queue.Queue()
+        for item in pending['requests']:
+            executor.submit(produce, item['move'], item['request'], chunks)
+        remaining = len(pending['requests'])
+        while remaining:
+            try:
+                label, text = chunks.get(timeout=ANALYSIS_STAGE_TIMEOUT)
+            except queue.Empty:
+                ERRORS.inc(component='stage_timeout')
+                break
+            if text is None:
+                remaining -= 1
+                yield server_event('done', {'move': label})
+            else:
+                yield server_event('commentary', {'move': label, 'text': text})
+        yield server_event('end', {})
+    
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def server_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 @app.route('/health')
 def health_check():
     return jsonify({"status": "healthy"})
 
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,198 @@
+"""Vectorized static evaluation of many positions at once with NumPy.
+
+Positions come in as an (N, 64) uint8 array of piece codes, one row per ChessGame.encode_board(),
+and leave as a vector of centipawn scores from white's point of view: material and piece-square
+values (the local engine's tables), mobility and king safety.
+
+Usage: python batch_eval.py [--positions 10000]
+"""
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+from chess_logic import (
+    ChessGame, BOARD_SQUARES, KNIGHT_OFFSETS, BISHOP_DIRECTIONS, ROOK_DIRECTIONS, EMPTY, COLOR_MASK,
+    PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, WHITE, BLACK, move_coords, move_promotion
+)
+from local_engine import SQUARE_SCORES, evaluate
+
+# Positions evaluated per vectorized pass; bounds the size of the ray arrays
+CHUNK_SIZE = 1024
+
+# Centipawns per square a piece attacks that is not taken by its own side
+MOBILITY_WEIGHTS = {KNIGHT: 4, BISHOP: 5, ROOK: 2, QUEEN: 1}
+# Own pawns one and two ranks in front of the king, and files next to it without an own pawn
+SHIELD_BONUS = (12, 6)
+OPEN_FILE_PENALTY = 15
+# King safety fades as the opponent's pieces come off, down to nothing with only pawns left
+PHASE_WEIGHTS = {KNIGHT: 1, BISHOP: 1, ROOK: 2, QUEEN: 4}
+MAX_PHASE = 12
+
+# Padding code past the board edge: occupied, but by no one a piece could capture
+OFF_BOARD = 16
+PADDING = 64
+
+
+def _index(square):
+    return (square >> 4) * 8 + (square & 7)
+
+
+def _build_targets(offsets, slide):
+    """(64, len(offsets), steps) target indices per square and direction, padded with PADDING."""
+    steps = 8 if slide else 1  # one more step than a ray can take, so every ray ends in padding
+    targets = np.full((64, len(offsets), steps), PADDING, dtype=np.intp)
+    for square in BOARD_SQUARES:
+        for direction, offset in enumerate(offsets):
+            target = square + offset
+            for step in range(steps):
+                if target & 0x88:
+                    break
+                targets[_index(square), direction, step] = _index(target)
+                target += offset
+    return targets
+
+
+def _build_shields():
+    """(2, 64, 6) squares in front of a king on each square, nearest rank first, per color."""
+    shields = np.full((2, 64, 6), PADDING, dtype=np.intp)
+    for color, forward in ((WHITE, -1), (BLACK, 1)):
+        for square in range(64):
+            row, col = divmod(square, 8)
+            for rank in range(2):
+                for file in range(3):
+                    r, c = row + forward * (rank + 1), col + file - 1
+                    if 0 <= r < 8 and 0 <= c < 8:
+                        shields[color >> 3, square, rank * 3 + file] = r * 8 + c
+    return shields
+
+
+def _piece_weights(weights):
+    """Per piece code: the weight for white's pieces, negated for black's."""
+    table = np.zeros(OFF_BOARD + 1, dtype=np.int32)
+    for piece_type, weight in weights.items():
+        table[WHITE | piece_type] = weight
+        table[BLACK | piece_type] = -weight
+    return table
+
+
+SQUARE_TABLE = np.array([[scores[square] for square in BOARD_SQUARES] for scores in SQUARE_SCORES], dtype=np.int32)
+# Knights take one step in each direction, queens move along both kinds of ray
+MOBILITY_TARGETS = (
+    (_build_targets(KNIGHT_OFFSETS, slide=False), _piece_weights({KNIGHT: MOBILITY_WEIGHTS[KNIGHT]})),
+    (_build_targets(BISHOP_DIRECTIONS, slide=True),
+     _piece_weights({BISHOP: MOBILITY_WEIGHTS[BISHOP], QUEEN: MOBILITY_WEIGHTS[QUEEN]})),
+    (_build_targets(ROOK_DIRECTIONS, slide=True),
+     _piece_weights({ROOK: MOBILITY_WEIGHTS[ROOK], QUEEN: MOBILITY_WEIGHTS[QUEEN]})),
+)
+SHIELD_INDICES = _build_shields()
+PHASE_TABLE = np.abs(_piece_weights(PHASE_WEIGHTS))
+
+
+def stack_boards(encoded_boards):
+    """Stack ChessGame.encode_board() results into an (N, 64) uint8 array."""
+    return np.frombuffer(b''.join(encoded_boards), dtype=np.uint8).reshape(-1, 64)
+
+
+def evaluate_batch(boards):
+    """Score positions in centipawns from white's point of view.
+
+    boards is an (N, 64) uint8 array of piece codes or a sequence of ChessGame.encode_board() results.
+    """
+    if not isinstance(boards, np.ndarray):
+        boards = stack_boards(boards)
+    scores = np.empty(len(boards), dtype=np.int32)
+    for start in range(0, len(boards), CHUNK_SIZE):
+        scores[start:start + CHUNK_SIZE] = _evaluate_chunk(boards[start:start + CHUNK_SIZE])
+    return scores
+
+
+def _evaluate_chunk(boards):
+    padded = np.concatenate([boards, np.full((len(boards), 1), OFF_BOARD, dtype=np.uint8)], axis=1)
+    return (SQUARE_TABLE[boards, np.arange(64)].sum(axis=1)
+            + _mobility(boards, padded)
+            + _king_safety(boards, padded, WHITE)
+            - _king_safety(boards, padded, BLACK))
+
+
+def _attackable(targets, colors):
+    """Whether target squares are empty or hold a piece of the other color than the attacker's."""
+    return (targets == EMPTY) | ((targets != OFF_BOARD) & ((targets & COLOR_MASK) != colors))
+
+
+def _mobility(boards, padded):
+    score = np.zeros(len(boards))
+    for targets, weights in MOBILITY_TARGETS:
+        # Only the squares holding a piece that moves this way, from every position at once
+        positions, squares = np.nonzero(weights[boards])
+        pieces = boards[positions, squares]
+        along = padded.ravel().take(positions[:, None, None] * 65 + targets[squares])  # (pieces, directions, steps)
+        # Empty squares up to the first blocker, plus the blocker itself when it can be captured
+        reach = (along != EMPTY).argmax(axis=2)
+        blocker = np.take_along_axis(along, reach[..., None], axis=2)[..., 0]
+        moves = (reach + _attackable(blocker, (pieces & COLOR_MASK)[:, None])).sum(axis=1)
+        score += np.bincount(positions, weights=weights[pieces] * moves, minlength=len(boards))
+    return score.astype(np.int32)
+
+
+def _king_safety(boards, padded, color):
+    """Pawn shield and open files around the king of one color, scaled by the opponent's attacking material."""
+    rows = np.arange(len(boards))
+    king = (boards == color | KING).argmax(axis=1)
+    shield = padded[rows[:, None], SHIELD_INDICES[color >> 3][king]] == color | PAWN
+    score = shield[:, :3].sum(axis=1) * SHIELD_BONUS[0] + shield[:, 3:].sum(axis=1) * SHIELD_BONUS[1]
+
+    # Files are padded on both sides with a pawn so the board edge never counts as open
+    pawn_files = (boards.reshape(-1, 8, 8) == color | PAWN).any(axis=1)
+    pawn_files = np.pad(pawn_files, ((0, 0), (1, 1)), constant_values=True)
+    open_files = ~pawn_files[rows[:, None], (king % 8)[:, None] + np.arange(3)]
+    score -= open_files.sum(axis=1) * OPEN_FILE_PENALTY
+
+    enemy = (boards & COLOR_MASK) != color
+    phase = np.minimum((PHASE_TABLE[boards] * enemy).sum(axis=1), MAX_PHASE)
+    return score * phase // MAX_PHASE
+
+
+def _random_positions(count, seed=1):
+    """Positions from random playouts, for the benchmark."""
+    rng = random.Random(seed)
+    games = []
+    while len(games) < count:
+        game = ChessGame()
+        game.create_initial_board()
+        for _ in range(rng.randrange(10, 80)):
+            moves = game.generate_legal_moves()
+            if not moves:
+                break
+            move = rng.choice(moves)
+            game.make_move(*move_coords(move), move_promotion(move))
+        games.append(game)
+    return games
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the batch evaluator against per-position evaluation.')
+    parser.add_argument('--positions', type=int, default=10000, help='random positions to evaluate')
+    args = parser.parse_args()
+
+    games = _random_positions(args.positions)
+
+    def timed(label, detail, run):
+        start = time.perf_counter()
+        result = run()
+        print(f"{label:<24}{args.positions / (time.perf_counter() - start):12,.0f} positions/s  {detail}".rstrip())
+        return result
+
+    boards = timed('encode_board', '', lambda: stack_boards([game.encode_board() for game in games]))
+    timed('evaluate_batch', '(material, piece-square tables, mobility, king safety)', lambda: evaluate_batch(boards))
+    timed('evaluate_batch, one each', '(the same, one position per call)',
+          lambda: [evaluate_batch(boards[index:index + 1]) for index in range(len(boards))])
+    timed('local_engine.evaluate', '(material and piece-square tables only)',
+          lambda: [evaluate(game) for game in games])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
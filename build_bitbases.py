@@ -0,0 +1,208 @@
+"""Generate the endgame tables read by endgame_tables.py by retrograde analysis.
+
+Every position of an endgame is indexed at once as NumPy arrays. Mates and stalemates are marked
+first, then each pass marks the positions won or lost one ply further from mate until nothing changes;
+whatever is left is a draw. KPK looks up the KQK and KRK results after a promotion, so they are built first.
+
+Usage: python build_bitbases.py [-o endgames] [KQK KRK KPK]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from chess_logic import PAWN, ROOK, QUEEN
+from endgame_tables import (
+    HEADER, MAGIC, FORMAT_VERSION, ENDGAMES, POSITIONS, DRAW, WIN, LOSS, INVALID, table_index
+)
+
+HALF = POSITIONS // 2
+UNKNOWN = -1
+ENDGAME_PIECES = {name: piece_type for piece_type, name in ENDGAMES.items()}
+# Built before the endgames that promote into them
+DEPENDENCIES = {'KPK': ('KQK', 'KRK')}
+
+
+def _build_geometry():
+    """King targets, king distance, slider lines, squares between two squares and pawn captures on a 64-square board."""
+    rows, cols = np.divmod(np.arange(64), 8)
+    row_delta = rows[None, :] - rows[:, None]
+    col_delta = cols[None, :] - cols[:, None]
+    near = np.maximum(np.abs(row_delta), np.abs(col_delta)) <= 1
+
+    king_targets = np.full((64, 8), -1)
+    for square in range(64):
+        for direction, (dr, dc) in enumerate(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))):
+            row, col = rows[square] + dr, cols[square] + dc
+            if 0 <= row < 8 and 0 <= col < 8:
+                king_targets[square, direction] = row * 8 + col
+
+    different = ~np.eye(64, dtype=bool)
+    straight = ((row_delta == 0) | (col_delta == 0)) & different
+    diagonal = (np.abs(row_delta) == np.abs(col_delta)) & different
+    between = np.zeros((64, 64, 64), dtype=bool)
+    for frm, to in zip(*np.nonzero(straight | diagonal)):
+        steps = max(abs(row_delta[frm, to]), abs(col_delta[frm, to]))
+        step = (row_delta[frm, to] // steps) * 8 + col_delta[frm, to] // steps
+        between[frm, to, frm + step * np.arange(1, steps)] = True
+
+    # A white pawn captures up the board (towards row 0)
+    pawn_captures = (row_delta == -1) & (np.abs(col_delta) == 1)
+    lines = {QUEEN: straight | diagonal, ROOK: straight}
+    return king_targets, near, lines, between, pawn_captures
+
+
+KING_TARGETS, NEAR, LINES, BETWEEN, PAWN_CAPTURES = _build_geometry()
+
+
+def _attacks(piece_type, piece, target, blocker):
+    """Whether the piece on `piece` attacks `target` when the only other piece in the way could be on `blocker`."""
+    if piece_type == PAWN:
+        return PAWN_CAPTURES[piece, target]
+    return LINES[piece_type][piece, target] & ~BETWEEN[piece, target, blocker]
+
+
+def _child(to_move, strong_king, weak_king, piece):
+    return table_index(to_move, strong_king, weak_king, piece)
+
+
+def build(name, solved):
+    """Solve one endgame; returns (results, plies) arrays over all table indices.
+
+    solved holds the (results, plies) of the endgames this one can promote into.
+    """
+    piece_type = ENDGAME_PIECES[name]
+    index = np.arange(POSITIONS)
+    to_move, strong_king, weak_king, piece = index >> 18, (index >> 12) & 63, (index >> 6) & 63, index & 63
+
+    weak_in_check = _attacks(piece_type, piece, weak_king, strong_king)
+    legal = (strong_king != piece) & (weak_king != piece) & ~NEAR[strong_king, weak_king]
+    legal &= ~((to_move == 0) & weak_in_check)
+    if piece_type == PAWN:
+        legal &= (piece >= 8) & (piece < 56)
+
+    # Positions after the last index stand for moves leaving the endgame, with fixed results
+    fixed_results, fixed_plies = [DRAW], [0]
+    parents, children = [], []
+
+    def add_moves(mask, child):
+        parents.append(index[mask])
+        children.append(child[mask])
+
+    def add_exits(mask, results, plies):
+        parents.append(index[mask])
+        children.append(POSITIONS + len(fixed_results) + np.arange(mask.sum()))
+        fixed_results.extend(results[mask].tolist())
+        fixed_plies.extend(plies[mask].tolist())
+
+    # The side with the extra piece: king moves
+    strong = legal & (to_move == 0)
+    for direction in range(8):
+        target = KING_TARGETS[strong_king, direction]
+        add_moves(strong & (target >= 0) & (target != piece) & ~NEAR[target, weak_king],
+                  _child(1, target, weak_king, piece))
+
+    # ... and piece moves: slides that stop short of both kings, or pawn pushes and promotions
+    if piece_type == PAWN:
+        push = piece - 8
+        single = strong & (push != strong_king) & (push != weak_king)
+        add_moves(single & (push >= 8), _child(1, strong_king, weak_king, push))
+        double = single & (piece >= 48) & (piece - 16 != strong_king) & (piece - 16 != weak_king)
+        add_moves(double, _child(1, strong_king, weak_king, piece - 16))
+        promoting = single & (push < 8)
+        for promoted in ('KQK', 'KRK'):
+            results, plies = solved[promoted]
+            after = _child(1, strong_king, weak_king, push)
+            add_exits(promoting, results[after], plies[after])
+        # Promoting to a bishop or knight leaves a dead draw
+        add_moves(promoting, np.full(POSITIONS, POSITIONS))
+    else:
+        for target in range(64):
+            add_moves(strong & LINES[piece_type][piece, target] & (target != strong_king) & (target != weak_king)
+                      & ~BETWEEN[piece, target, strong_king] & ~BETWEEN[piece, target, weak_king],
+                      _child(1, strong_king, weak_king, target))
+
+    # The lone king: any square not next to the other king or attacked, or taking an undefended piece
+    weak = legal & (to_move == 1)
+    for direction in range(8):
+        target = KING_TARGETS[weak_king, direction]
+        allowed = weak & (target >= 0) & ~NEAR[target, strong_king]
+        takes = allowed & (target == piece)
+        add_moves(takes, np.full(POSITIONS, POSITIONS))
+        safe = allowed & (target != piece) & ~_attacks(piece_type, piece, target, strong_king)
+        add_moves(safe, _child(0, strong_king, target, piece))
+
+    parent, child = np.concatenate(parents), np.concatenate(children)
+    moves = np.bincount(parent, minlength=POSITIONS)
+
+    results = np.full(POSITIONS + len(fixed_results), UNKNOWN, dtype=np.int8)
+    plies = np.zeros(POSITIONS + len(fixed_results), dtype=np.int16)
+    results[POSITIONS:], plies[POSITIONS:] = fixed_results, fixed_plies
+    results[:POSITIONS][~legal] = INVALID
+    stuck = legal & (moves == 0)
+    results[:POSITIONS][stuck & (to_move == 1) & weak_in_check] = LOSS
+    results[:POSITIONS][stuck & ~((to_move == 1) & weak_in_check)] = DRAW
+
+    longest_exit = max(fixed_plies)
+    depth = 1
+    while True:
+        child_results, child_plies = results[child], plies[child]
+        # Won: some move leaves the opponent lost; lost: every move leaves the opponent winning
+        wins = np.zeros(POSITIONS, dtype=bool)
+        wins[parent[(child_results == LOSS) & (child_plies == depth - 1)]] = True
+        losing_moves = np.bincount(parent[(child_results == WIN) & (child_plies < depth)], minlength=POSITIONS)
+        unknown = results[:POSITIONS] == UNKNOWN
+        won = unknown & wins
+        lost = unknown & ~wins & (moves > 0) & (losing_moves == moves)
+        results[:POSITIONS][won], results[:POSITIONS][lost] = WIN, LOSS
+        plies[:POSITIONS][won | lost] = depth
+        if not won.any() and not lost.any() and depth > longest_exit:
+            break
+        depth += 1
+
+    results = results[:POSITIONS]
+    results[results == UNKNOWN] = DRAW
+    return results, plies[:POSITIONS]
+
+
+def write_table(path, results, plies):
+    """Pack the results two bits per position and write them with the distances to mate."""
+    packed = results.astype(np.uint8).reshape(-1, 4)
+    packed = packed[:, 0] | packed[:, 1] << 2 | packed[:, 2] << 4 | packed[:, 3] << 6
+    distances = np.where((results == WIN) | (results == LOSS), plies, 0).astype(np.uint8)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, POSITIONS))
+        f.write(packed.tobytes())
+        f.write(distances.tobytes())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate endgame tables by retrograde analysis.')
+    parser.add_argument('endgames', nargs='*', help=f"endgames to write, of {' '.join(ENDGAME_PIECES)} (default: all)")
+    parser.add_argument('-o', '--output', default='endgames', help='directory to write the tables to')
+    args = parser.parse_args()
+
+    endgames = args.endgames or list(ENDGAME_PIECES)
+    unknown = [name for name in endgames if name not in ENDGAME_PIECES]
+    if unknown:
+        parser.error(f"unknown endgame {unknown[0]}")
+    os.makedirs(args.output, exist_ok=True)
+    solved = {}
+    for name in endgames:
+        for needed in DEPENDENCIES.get(name, ()) + (name,):
+            if needed in solved:
+                continue
+            start = time.perf_counter()
+            results, plies = solved[needed] = build(needed, solved)
+            legal_wins = (results[:HALF] == WIN).sum()
+            print(f"{needed}: {(results != INVALID).sum()} positions, {legal_wins} won with the extra piece to move, "
+                  f"longest mate {plies.max()} plies, {time.perf_counter() - start:.1f}s")
+        write_table(os.path.join(args.output, f"{name}.bin"), *solved[name])
+    print(f"Wrote {', '.join(endgames)} to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
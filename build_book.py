@@ -0,0 +1,65 @@
+"""Build a Polyglot-layout opening book from PGN files.
+
+The book is keyed by ChessGame.zobrist_key(), so only opening_book.py can read it, not other Polyglot readers.
+
+Usage: python build_book.py games.pgn [more.pgn ...] -o book.bin [--max-ply 24] [--min-count 3]
+"""
+import argparse
+from collections import defaultdict
+
+from opening_book import ENTRY, MAX_WEIGHT, encode_book_move
+from pgn import read_games, replay
+
+# (white, black) points per result: Polyglot's usual 2 per win, 1 per draw
+RESULT_POINTS = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1)}
+
+
+def collect_moves(paths, max_ply=24):
+    """Count games and score every (position key, book move) pair seen in the opening of each game."""
+    stats = defaultdict(lambda: [0, 0])  # (key, book_move) -> [games, points]
+    games = skipped = 0
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for headers, san_moves in read_games(f):
+                points = RESULT_POINTS.get(headers.get('Result'), (0, 0))
+                try:
+                    for game, move in replay(san_moves[:max_ply], headers.get('FEN')):
+                        entry = stats[(game.zobrist_key(), encode_book_move(move))]
+                        entry[0] += 1
+                        entry[1] += points[0 if game.current_turn == 'white' else 1]
+                    games += 1
+                except ValueError as e:
+                    # Keep whatever plies replayed cleanly and move on to the next game
+                    skipped += 1
+                    print(f"Skipping rest of game {games + skipped}: {e}")
+    return stats, games, skipped
+
+
+def write_book(stats, path, min_count=1):
+    """Write the sorted book file, scaling weights into 16 bits; returns the number of entries."""
+    entries = [(key, book_move, points) for (key, book_move), (count, points) in stats.items()
+               if count >= min_count and points > 0]
+    scale = max((points for _, _, points in entries), default=0) / MAX_WEIGHT
+    entries.sort()
+    with open(path, 'wb') as f:
+        for key, book_move, points in entries:
+            weight = max(1, round(points / scale)) if scale > 1 else points
+            f.write(ENTRY.pack(key, book_move, weight, 0))
+    return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a Polyglot-layout opening book from PGN files.')
+    parser.add_argument('pgn', nargs='+', help='PGN files to read')
+    parser.add_argument('-o', '--output', default='book.bin', help='book file to write')
+    parser.add_argument('--max-ply', type=int, default=24, help='plies of each game to include')
+    parser.add_argument('--min-count', type=int, default=1, help='drop moves played in fewer games')
+    args = parser.parse_args()
+
+    stats, games, skipped = collect_moves(args.pgn, args.max_ply)
+    count = write_book(stats, args.output, args.min_count)
+    print(f"Read {games} games ({skipped} with unreadable moves), wrote {count} entries to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,282 +1,802 @@
-from ai_engine import get_piece_type, get_piece_color
+import random
+import re
+
+from tables import load_tables
+
+# Piece codes: the low three bits hold the piece type, bit 3 holds the colour.
+EMPTY = 0
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 1, 2, 3, 4, 5, 6
+WHITE, BLACK = 0, 8
+TYPE_MASK, COLOR_MASK = 7, 8
+
+COLOR_BITS = {'white': WHITE, 'black': BLACK}
+COLOR_NAMES = {WHITE: 'white', BLACK: 'black'}
+TYPE_NAMES = (None, 'pawn', 'knight', 'bishop', 'rook', 'queen', 'king')
+PROMOTION_TYPES = {'queen': QUEEN, 'rook': ROOK, 'bishop': BISHOP, 'knight': KNIGHT}
+
+GLYPHS = {
+    WHITE | KING: '♔', WHITE | QUEEN: '♕', WHITE | ROOK: '♖',
+    WHITE | BISHOP: '♗', WHITE | KNIGHT: '♘', WHITE | PAWN: '♙',
+    BLACK | KING: '♚', BLACK | QUEEN: '♛', BLACK | ROOK: '♜',
+    BLACK | BISHOP: '♝', BLACK | KNIGHT: '♞', BLACK | PAWN: '♟',
+    EMPTY: ' '
+}
+PIECE_CODES = {glyph: code for code, glyph in GLYPHS.items()}
+
+FEN_LETTERS = {code: letter for code, letter in zip(
+    (WHITE | KING, WHITE | QUEEN, WHITE | ROOK, WHITE | BISHOP, WHITE | KNIGHT, WHITE | PAWN,
+     BLACK | KING, BLACK | QUEEN, BLACK | ROOK, BLACK | BISHOP, BLACK | KNIGHT, BLACK | PAWN),
+    'KQRBNPkqrbnp')}
+FEN_CODES = {letter: code for code, letter in FEN_LETTERS.items()}
+
+BACK_RANK = (ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK)
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# Castling rights bitmask
+CASTLE_WK, CASTLE_WQ, CASTLE_BK, CASTLE_BQ = 1, 2, 4, 8
+CASTLING_LETTERS = ((CASTLE_WK, 'K'), (CASTLE_WQ, 'Q'), (CASTLE_BK, 'k'), (CASTLE_BQ, 'q'))
+
+# Moves are ints: bits 0-6 from square, bits 7-13 to square, bits 14-16 promotion type, bits 17+ flags
+PROMOTION_SHIFT = 14
+DOUBLE_PUSH = 1 << 17
+EN_PASSANT = 2 << 17
+CASTLE = 4 << 17
+
+# Precomputed move tables, indexed by 0x88 square
+BOARD_SQUARES = tuple(square for square in range(128) if not square & 0x88)
+KNIGHT_OFFSETS = (-33, -31, -18, -14, 14, 18, 31, 33)
+KING_OFFSETS = (-17, -16, -15, -1, 1, 15, 16, 17)
+BISHOP_DIRECTIONS = (-17, -15, 15, 17)
+ROOK_DIRECTIONS = (-16, -1, 1, 16)
+
+
+def _on_board(square):
+    return 0 <= square < 128 and not square & 0x88
+
+
+def _build_leaper_table(offsets):
+    """Map every square to the tuple of on-board squares reachable by a single jump."""
+    table = [()] * 128
+    for square in BOARD_SQUARES:
+        table[square] = tuple(square + offset for offset in offsets if _on_board(square + offset))
+    return table
+
+
+def _build_ray_table(directions):
+    """Map every square to one tuple of squares per direction, ordered outwards from the square."""
+    table = [()] * 128
+    for square in BOARD_SQUARES:
+        rays = []
+        for direction in directions:
+            ray = []
+            target = square + direction
+            while _on_board(target):
+                ray.append(target)
+                target += direction
+            if ray:
+                rays.append(tuple(ray))
+        table[square] = tuple(rays)
+    return table
+
+
+# Rights that survive a move touching each square (king and rook home squares clear theirs)
+CASTLING_MASK = [CASTLE_WK | CASTLE_WQ | CASTLE_BK | CASTLE_BQ] * 128
+CASTLING_MASK[0x00] &= ~CASTLE_BQ
+CASTLING_MASK[0x04] &= ~(CASTLE_BK | CASTLE_BQ)
+CASTLING_MASK[0x07] &= ~CASTLE_BK
+CASTLING_MASK[0x70] &= ~CASTLE_WQ
+CASTLING_MASK[0x74] &= ~(CASTLE_WK | CASTLE_WQ)
+CASTLING_MASK[0x77] &= ~CASTLE_WK
+
+
+def _build_zobrist_tables():
+    """Generate fixed 64-bit Zobrist keys (seeded so keys are stable across processes; not Polyglot's Random64 values)."""
+    rng = random.Random(0x0C4E55)
+    pieces = [[0] * 128 for _ in range(16)]
+    for piece in FEN_LETTERS:
+        for square in BOARD_SQUARES:
+            pieces[piece][square] = rng.getrandbits(64)
+    rights = [rng.getrandbits(64) for _ in range(4)]
+    castling = [0] * 16
+    for mask in range(16):
+        for bit in range(4):
+            if mask & (1 << bit):
+                castling[mask] ^= rights[bit]
+    ep_files = [rng.getrandbits(64) for _ in range(8)]
+    return pieces, castling, ep_files, rng.getrandbits(64)
+
+
+def _build_tables():
+    """Build the move and Zobrist tables; normally they are loaded ready-made from the tables artifact."""
+    bishop_rays = _build_ray_table(BISHOP_DIRECTIONS)
+    rook_rays = _build_ray_table(ROOK_DIRECTIONS)
+    return {
+        'knight_targets': _build_leaper_table(KNIGHT_OFFSETS),
+        'king_targets': _build_leaper_table(KING_OFFSETS),
+        'pawn_captures': (_build_leaper_table((-17, -15)), _build_leaper_table((15, 17))),
+        'bishop_rays': bishop_rays,
+        'rook_rays': rook_rays,
+        'queen_rays': [bishop_rays[square] + rook_rays[square] for square in range(128)],
+        'zobrist': _build_zobrist_tables()
+    }
+
+
+_tables = load_tables('chess_logic', _build_tables)
+KNIGHT_TARGETS = _tables['knight_targets']
+KING_TARGETS = _tables['king_targets']
+# Pawn captures indexed by [color >> 3][square]
+PAWN_CAPTURES = _tables['pawn_captures']
+BISHOP_RAYS = _tables['bishop_rays']
+ROOK_RAYS = _tables['rook_rays']
+QUEEN_RAYS = _tables['queen_rays']
+SLIDER_RAYS = {BISHOP: BISHOP_RAYS, ROOK: ROOK_RAYS, QUEEN: QUEEN_RAYS}
+ZOBRIST_PIECES, ZOBRIST_CASTLING, ZOBRIST_EP_FILE, ZOBRIST_WHITE_TO_MOVE = _tables['zobrist']
+
+
+def square_index(row, col):
+    """Convert a (row, col) pair into a 0x88 square index (row 0 is rank 8)."""
+    return (row << 4) | col
+
+
+def square_coords(square):
+    """Convert a 0x88 square index back into a (row, col) pair."""
+    return square >> 4, square & 7
+
+
+def move_coords(move):
+    """Get the (from_row, from_col, to_row, to_col) coordinates of an encoded move."""
+    frm, to = move & 0x7F, (move >> 7) & 0x7F
+    return frm >> 4, frm & 7, to >> 4, to & 7
+
+
+def move_promotion(move):
+    """Get the promotion piece name of an encoded move, or None."""
+    return TYPE_NAMES[(move >> PROMOTION_SHIFT) & 7]
+
+
+def move_to_uci(move):
+    """Convert an encoded move to UCI notation, e.g. 'e2e4' or 'e7e8q'."""
+    from_row, from_col, to_row, to_col = move_coords(move)
+    promotion = (move >> PROMOTION_SHIFT) & 7
+    uci = f"{'abcdefgh'[from_col]}{8 - from_row}{'abcdefgh'[to_col]}{8 - to_row}"
+    return uci + ' pnbrqk'[promotion] if promotion else uci
+
 
 class ChessGame:
     def __init__(self):
-        self.board = None
+        # 0x88 board: 128 small-int piece codes, only indices with (index & 0x88) == 0 are on the board
+        self.squares = [EMPTY] * 128
         self.current_turn = 'white'
         self.game_over = False
         self.winner = None
+        self.result = None
         self.player_color = None
         self.is_player_turn = True
-        self.king_moved = {'white': False, 'black': False}
-        self.rook_moved = {'white': [False, False], 'black': [False, False]}  # [left rook, right rook]
+        self.castling_rights = CASTLE_WK | CASTLE_WQ | CASTLE_BK | CASTLE_BQ
+        self.ep_square = None  # square skipped by the last double pawn push
+        self.halfmove_clock = 0  # plies since the last capture or pawn move
+        self.fullmove_number = 1
+        self.moves = []  # moves played so far, in UCI notation
+        self.version = 0  # bumped on every change of position, so clients can tell whether they are in sync
+        self._key = 0  # Zobrist key without the en passant part, updated by _apply_move
+        self.history = []  # (encoded move, undo record) per move played, for takebacks
+        self.position_keys = []  # Zobrist key of every position since the board was set up, for repetitions
+        self._fen = None  # FEN of the current position, built on demand and dropped when a move is applied
+        # Kept up to date by _make/_unmake: occupied squares per color and king squares, indexed by color >> 3
+        self.piece_squares = (set(), set())
+        self.king_squares = [None, None]
+
+    @property
+    def board(self):
+        """Render the board as an 8x8 grid of Unicode glyphs (for templates and JSON responses)."""
+        squares = self.squares
+        return [[GLYPHS[squares[(row << 4) | col]] for col in range(8)] for row in range(8)]
+
+    def piece_at(self, row, col):
+        """Get the glyph of the piece on a square, or ' ' if it is empty."""
+        return GLYPHS[self.squares[(row << 4) | col]]
 
     def create_initial_board(self):
         """Initialize the chess board with pieces in starting positions."""
-        pieces = {
-            'white': {'king': '♔', 'queen': '♕', 'rook': '♖',
-                     'bishop': '♗', 'knight': '♘', 'pawn': '♙'},
-            'black': {'king': '♚', 'queen': '♛', 'rook': '♜',
-                     'bishop': '♝', 'knight': '♞', 'pawn': '♟'}
-        }
-        
-        self.board = [[' ' for _ in range(8)] for _ in range(8)]
-        
-        # Set up black pieces
-        self.board[0] = [pieces['black']['rook'], pieces['black']['knight'], pieces['black']['bishop'],
-                        pieces['black']['queen'], pieces['black']['king'], pieces['black']['bishop'],
-                        pieces['black']['knight'], pieces['black']['rook']]
-        self.board[1] = [pieces['black']['pawn']] * 8
-        
-        # Set up white pieces
-        self.board[6] = [pieces['white']['pawn']] * 8
-        self.board[7] = [pieces['white']['rook'], pieces['white']['knight'], pieces['white']['bishop'],
-                        pieces['white']['queen'], pieces['white']['king'], pieces['white']['bishop'],
-                        pieces['white']['knight'], pieces['white']['rook']]
-        
+        self.squares = [EMPTY] * 128
+
+        for col, piece_type in enumerate(BACK_RANK):
+            # Set up black pieces
+            self.squares[square_index(0, col)] = BLACK | piece_type
+            self.squares[square_index(1, col)] = BLACK | PAWN
+            # Set up white pieces
+            self.squares[square_index(6, col)] = WHITE | PAWN
+            self.squares[square_index(7, col)] = WHITE | piece_type
+
+        self._index_pieces()
+        self.castling_rights = CASTLE_WK | CASTLE_WQ | CASTLE_BK | CASTLE_BQ
+        self.ep_square = None
+        self.current_turn = 'white'
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.moves = []
+        self.game_over = False
+        self.winner = None
+        self.result = None
+        self._reset_position_keys()
         return self.board
 
-    def is_valid_move(self, from_row, from_col, to_row, to_col):
+    @classmethod
+    def from_fen(cls, fen):
+        """Create a game from a FEN string (the move clocks are optional); raises ValueError if it is malformed."""
+        game = cls()
+        game.load_fen(fen)
+        game.update_game_status()
+        return game
+
+    def load_fen(self, fen):
+        """Set up the board, side to move, castling rights, en passant square and clocks from a FEN string."""
+        fields = fen.split()
+        if len(fields) not in (4, 6) or fields[1] not in ('w', 'b') \
+                or not re.fullmatch(r'-|[KQkq]+', fields[2]) or not re.fullmatch(r'-|[a-h][36]', fields[3]) \
+                or len(fields) == 6 and not (fields[4].isdigit() and fields[5].isdigit()):
+            raise ValueError(f"Invalid FEN: {fen!r}")
+
+        rows = fields[0].split('/')
+        if len(rows) != 8:
+            raise ValueError(f"Invalid FEN: {fen!r}")
+
+        squares = [EMPTY] * 128
+        for row, fen_row in enumerate(rows):
+            col = 0
+            for char in fen_row:
+                if char.isdigit():
+                    col += int(char)
+                elif char in FEN_CODES and col < 8:
+                    squares[square_index(row, col)] = FEN_CODES[char]
+                    col += 1
+                else:
+                    raise ValueError(f"Invalid FEN: {fen!r}")
+            if col != 8:
+                raise ValueError(f"Invalid FEN: {fen!r}")
+        # Move generation relies on one king per side and no pawn on a back rank
+        if squares.count(WHITE | KING) != 1 or squares.count(BLACK | KING) != 1 \
+                or any(squares[square_index(row, col)] & TYPE_MASK == PAWN for row in (0, 7) for col in range(8)):
+            raise ValueError(f"Invalid FEN: {fen!r}")
+        ep_square = None if fields[3] == '-' else \
+            square_index(8 - int(fields[3][1]), 'abcdefgh'.index(fields[3][0]))
+        if ep_square is not None:
+            # Only right after the opponent's double push: their pawn in front, its start square empty
+            forward = -16 if fields[1] == 'w' else 16
+            pawn = (BLACK if fields[1] == 'w' else WHITE) | PAWN
+            if fields[3][1] != ('6' if fields[1] == 'w' else '3') or squares[ep_square] != EMPTY \
+                    or squares[ep_square - forward] != pawn or squares[ep_square + forward] != EMPTY:
+                raise ValueError(f"Invalid FEN: {fen!r}")
+
+        self.squares = squares
+        self._index_pieces()
+        self.current_turn = 'white' if fields[1] == 'w' else 'black'
+        self.castling_rights = sum(right for right, letter in CASTLING_LETTERS if letter in fields[2])
+        self.ep_square = ep_square
+        self.halfmove_clock = int(fields[4]) if len(fields) == 6 else 0
+        self.fullmove_number = max(1, int(fields[5])) if len(fields) == 6 else 1
+        self.moves = []
+        self.game_over = False
+        self.winner = None
+        self.result = None
+        self._reset_position_keys()
+
+    def _index_pieces(self):
+        """Rebuild the piece lists and king squares from the board."""
+        self.piece_squares = (set(), set())
+        self.king_squares = [None, None]
+        for square in BOARD_SQUARES:
+            piece = self.squares[square]
+            if piece:
+                self.piece_squares[piece >> 3].add(square)
+                if piece & TYPE_MASK == KING:
+                    self.king_squares[piece >> 3] = square
+
+    def _reset_position_keys(self):
+        """Recompute the Zobrist key from scratch, drop the cached FEN and start a new history after the board was set up."""
+        squares = self.squares
+        key = ZOBRIST_CASTLING[self.castling_rights]
+        for pieces in self.piece_squares:
+            for square in pieces:
+                key ^= ZOBRIST_PIECES[squares[square]][square]
+        if self.current_turn == 'white':
+            key ^= ZOBRIST_WHITE_TO_MOVE
+        self._key = key
+        self._fen = None
+        self.history = []
+        self.position_keys = [self.zobrist_key()]
+
+    def to_state(self):
+        """Serialize the game compactly: current FEN, the moves played in UCI notation, the player's side and the result."""
+        return {
+            'fen': self.to_fen(),
+            'moves': list(self.moves),
+            'version': self.version,
+            'player_color': self.player_color,
+            'is_player_turn': self.is_player_turn,
+            'game_over': self.game_over,
+            'result': self.result,
+            'winner': self.winner
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a game serialized by to_state by replaying its moves from the initial position."""
+        game = cls()
+        game.create_initial_board()
+        for uci in state['moves']:
+            game._push_move(game.move_from_uci(uci))
+        game.moves = list(state['moves'])
+        game.version = state.get('version', len(game.moves))
+        game.player_color = state['player_color']
+        game.is_player_turn = state['is_player_turn']
+        # Results the rules cannot rederive, such as an endgame table adjudication, are kept as saved
+        if state.get('game_over'):
+            game.game_over, game.result, game.winner = True, state['result'], state['winner']
+        game.update_game_status()
+        return game
+
+    def move_from_uci(self, uci):
+        """Encode a UCI move string such as 'e2e4' or 'e7e8q' for the current position."""
+        frm = square_index(8 - int(uci[1]), 'abcdefgh'.index(uci[0]))
+        to = square_index(8 - int(uci[3]), 'abcdefgh'.index(uci[2]))
+        promotion = {'q': 'queen', 'r': 'rook', 'b': 'bishop', 'n': 'knight'}.get(uci[4:5])
+        return self._encode_move(frm, to, promotion)
+
+    def is_valid_move(self, from_row, from_col, to_row, to_col, promotion=None):
         """Check if a move is valid according to chess rules."""
         # Quick boundary and basic checks
         if not (0 <= from_row < 8 and 0 <= from_col < 8 and 0 <= to_row < 8 and 0 <= to_col < 8):
             return False
-        
-        piece = self.board[from_row][from_col]
-        if piece == ' ' or get_piece_color(piece) != self.current_turn:
+
+        frm, to = square_index(from_row, from_col), square_index(to_row, to_col)
+        piece = self.squares[frm]
+        if piece == EMPTY or (piece & COLOR_MASK) != COLOR_BITS[self.current_turn]:
             return False
-        
-        # Check piece-specific rules and if the move would result in check
-        return self._is_valid_piece_move(from_row, from_col, to_row, to_col) and \
-               not self._would_be_in_check(from_row, from_col, to_row, to_col)
-
-    def _is_valid_piece_move(self, from_row, from_col, to_row, to_col):
-        """Validate move based on piece-specific rules."""
-        piece = self.board[from_row][from_col]
-        piece_color = get_piece_color(piece)
-        piece_type = get_piece_type(piece)
-        
-        # Cannot capture your own piece
-        target_piece = self.board[to_row][to_col]
-        if target_piece != ' ' and get_piece_color(target_piece) == piece_color:
+        if promotion not in (None, *PROMOTION_TYPES):
             return False
-        
-        # Check specific piece rules
-        if piece_type == 'king':
-            # Castling
-            if abs(to_col - from_col) == 2 and from_row == to_row:
-                return True
-            # Normal king move (one square in any direction)
-            return abs(to_row - from_row) <= 1 and abs(to_col - from_col) <= 1
-            
-        elif piece_type == 'queen':
-            # Queen moves like bishop or rook
-            is_diagonal = abs(to_row - from_row) == abs(to_col - from_col)
-            is_straight = from_row == to_row or from_col == to_col
-            return (is_diagonal or is_straight) and self._is_path_clear(from_row, from_col, to_row, to_col)
-            
-        elif piece_type == 'rook':
-            # Rook moves straight
-            return (from_row == to_row or from_col == to_col) and \
-                   self._is_path_clear(from_row, from_col, to_row, to_col)
-                   
-        elif piece_type == 'bishop':
-            # Bishop moves diagonally
-            return abs(to_row - from_row) == abs(to_col - from_col) and \
-                   self._is_path_clear(from_row, from_col, to_row, to_col)
-                   
-        elif piece_type == 'knight':
-            # Knight jumps in L-shape
-            row_diff = abs(to_row - from_row)
-            col_diff = abs(to_col - from_col)
-            return (row_diff == 2 and col_diff == 1) or (row_diff == 1 and col_diff == 2)
-            
-        elif piece_type == 'pawn':
-            # Pawn moves
-            direction = -1 if piece_color == 'white' else 1
-            start_row = 6 if piece_color == 'white' else 1
-            
-            # Forward move
-            if from_col == to_col and to_row == from_row + direction and self.board[to_row][to_col] == ' ':
-                return True
-                
-            # Initial two-square move
-            if from_row == start_row and from_col == to_col and to_row == from_row + 2 * direction:
-                return self.board[to_row][to_col] == ' ' and self.board[from_row + direction][from_col] == ' '
-                
-            # Diagonal capture
-            if to_row == from_row + direction and abs(to_col - from_col) == 1:
-                return self.board[to_row][to_col] != ' ' and get_piece_color(self.board[to_row][to_col]) != piece_color
-                
+
+        # Check piece-specific rules and if the move would result in check
+        move = self._encode_move(frm, to, promotion)
+        moves = []
+        self._generate_piece_moves(frm, moves)
+        return move in moves and not self._leaves_king_in_check(move)
+
+    def generate_legal_moves(self):
+        """Generate every legal move for the side to move as encoded ints."""
+        return [move for move in self.generate_pseudo_legal_moves() if not self._leaves_king_in_check(move)]
+
+    def legal_move_pairs(self):
+        """List the legal (from_row, from_col, to_row, to_col) pairs for the side to move, promotions collapsed."""
+        if self.game_over:
+            return []
+        return sorted({move_coords(move) for move in self.generate_legal_moves()})
+
+    def generate_pseudo_legal_moves(self):
+        """Generate the moves of the side to move without checking whether they leave the king in check."""
+        moves = []
+        for square in self.piece_squares[COLOR_BITS[self.current_turn] >> 3]:
+            self._generate_piece_moves(square, moves)
+        return moves
+
+    def _has_legal_move(self):
+        """Check whether the side to move has at least one legal move."""
+        # Copy the piece list: trying moves changes it while we iterate
+        for square in list(self.piece_squares[COLOR_BITS[self.current_turn] >> 3]):
+            moves = []
+            self._generate_piece_moves(square, moves)
+            for move in moves:
+                if not self._leaves_king_in_check(move):
+                    return True
         return False
 
-    def _is_path_clear(self, from_row, from_col, to_row, to_col):
-        """Check if the path between two positions is clear of pieces."""
-        row_step = 0 if from_row == to_row else (1 if to_row > from_row else -1)
-        col_step = 0 if from_col == to_col else (1 if to_col > from_col else -1)
-        
-        current_row, current_col = from_row + row_step, from_col + col_step
-        while current_row != to_row or current_col != to_col:
-            if self.board[current_row][current_col] != ' ':
-                return False
-            current_row += row_step
-            current_col += col_step
-            
-        return True
-
-    def _would_be_in_check(self, from_row, from_col, to_row, to_col):
-        """Check if move would leave king in check."""
-        temp_board = [row[:] for row in self.board]
-        temp_board[to_row][to_col] = temp_board[from_row][from_col]
-        temp_board[from_row][from_col] = ' '
-        return self._is_in_check(get_piece_color(self.board[from_row][from_col]), temp_board)
-
-    def _is_in_check(self, color, board):
+    def update_game_status(self):
+        """Detect checkmate, stalemate, insufficient material, the fifty-move rule or threefold repetition."""
+        if self.game_over:
+            return True
+
+        if not self._has_legal_move():
+            self.game_over = True
+            if self._is_in_check(self.current_turn):
+                self.result = 'checkmate'
+                self.winner = 'black' if self.current_turn == 'white' else 'white'
+            else:
+                self.result = 'stalemate'
+                self.winner = None
+        elif self.is_insufficient_material():
+            self.game_over, self.result, self.winner = True, 'insufficient material', None
+        elif self.halfmove_clock >= 100:
+            self.game_over, self.result, self.winner = True, 'fifty-move rule', None
+        elif self.is_threefold_repetition():
+            self.game_over, self.result, self.winner = True, 'threefold repetition', None
+        return self.game_over
+
+    def is_insufficient_material(self):
+        """Check whether neither side can ever mate: bare kings plus one knight, or bishops all on one square color."""
+        squares = self.squares
+        minors = []
+        for pieces in self.piece_squares:
+            for square in pieces:
+                piece_type = squares[square] & TYPE_MASK
+                if piece_type in (PAWN, ROOK, QUEEN):
+                    return False
+                if piece_type != KING:
+                    minors.append((piece_type, ((square >> 4) + square) & 1))
+        if len(minors) <= 1:
+            return True
+        return all(piece_type == BISHOP for piece_type, _ in minors) and len({color for _, color in minors}) == 1
+
+    def is_threefold_repetition(self):
+        """Check whether the current position occurred three times, by comparing Zobrist keys.
+
+        Only positions since the last capture or pawn move can repeat, and only every other one has the same side to move.
+        """
+        keys = self.position_keys
+        key = keys[-1]
+        stop = max(-1, len(keys) - 2 - self.halfmove_clock)
+        return sum(keys[index] == key for index in range(len(keys) - 1, stop, -2)) >= 3
+
+    def _generate_piece_moves(self, frm, moves):
+        """Append the pseudo-legal moves of the piece on frm to moves."""
+        squares = self.squares
+        piece = squares[frm]
+        color = piece & COLOR_MASK
+        piece_type = piece & TYPE_MASK
+
+        if piece_type == PAWN:
+            self._generate_pawn_moves(frm, color, moves)
+            return
+
+        if piece_type == KNIGHT or piece_type == KING:
+            targets = KNIGHT_TARGETS[frm] if piece_type == KNIGHT else KING_TARGETS[frm]
+            for to in targets:
+                target = squares[to]
+                if target == EMPTY or (target & COLOR_MASK) != color:
+                    moves.append(frm | to << 7)
+            if piece_type == KING:
+                self._generate_castling_moves(frm, color, moves)
+            return
+
+        # Sliders walk each ray until the first occupied square
+        for ray in SLIDER_RAYS[piece_type][frm]:
+            for to in ray:
+                target = squares[to]
+                if target == EMPTY:
+                    moves.append(frm | to << 7)
+                else:
+                    if (target & COLOR_MASK) != color:
+                        moves.append(frm | to << 7)
+                    break
+
+    def _generate_pawn_moves(self, frm, color, moves):
+        """Append pawn pushes, captures, en passant and promotions."""
+        squares = self.squares
+        forward, start_row = (-16, 6) if color == WHITE else (16, 1)
+
+        to = frm + forward
+        if squares[to] == EMPTY:
+            self._append_pawn_move(frm, to, moves)
+            if frm >> 4 == start_row and squares[to + forward] == EMPTY:
+                moves.append(frm | (to + forward) << 7 | DOUBLE_PUSH)
+
+        for to in PAWN_CAPTURES[color >> 3][frm]:
+            target = squares[to]
+            if target != EMPTY and (target & COLOR_MASK) != color:
+                self._append_pawn_move(frm, to, moves)
+            elif to == self.ep_square:
+                moves.append(frm | to << 7 | EN_PASSANT)
+
+    def _append_pawn_move(self, frm, to, moves):
+        """Append a pawn move, expanding it into the four promotions on the last rank."""
+        move = frm | to << 7
+        if to >> 4 == 0 or to >> 4 == 7:
+            for piece_type in (QUEEN, ROOK, BISHOP, KNIGHT):
+                moves.append(move | piece_type << PROMOTION_SHIFT)
+        else:
+            moves.append(move)
+
+    def _generate_castling_moves(self, frm, color, moves):
+        """Append castling moves; the king may not castle out of, through or into check."""
+        if color == WHITE:
+            home, king_side, queen_side = 0x74, CASTLE_WK, CASTLE_WQ
+        else:
+            home, king_side, queen_side = 0x04, CASTLE_BK, CASTLE_BQ
+        rights = self.castling_rights
+        if frm != home or not rights & (king_side | queen_side):
+            return
+
+        squares = self.squares
+        rook = color | ROOK
+        enemy = color ^ COLOR_MASK
+        if self._is_square_under_attack(frm, enemy):
+            return
+
+        if rights & king_side and squares[frm + 1] == EMPTY and squares[frm + 2] == EMPTY \
+                and squares[frm + 3] == rook and not self._is_square_under_attack(frm + 1, enemy) \
+                and not self._is_square_under_attack(frm + 2, enemy):
+            moves.append(frm | (frm + 2) << 7 | CASTLE)
+
+        if rights & queen_side and squares[frm - 1] == EMPTY and squares[frm - 2] == EMPTY \
+                and squares[frm - 3] == EMPTY and squares[frm - 4] == rook \
+                and not self._is_square_under_attack(frm - 1, enemy) \
+                and not self._is_square_under_attack(frm - 2, enemy):
+            moves.append(frm | (frm - 2) << 7 | CASTLE)
+
+    def _encode_move(self, frm, to, promotion=None):
+        """Build an encoded move from two squares, inferring its special-move flags from the board."""
+        piece = self.squares[frm]
+        piece_type = piece & TYPE_MASK
+        move = frm | to << 7
+
+        if piece_type == KING and abs(to - frm) == 2:
+            move |= CASTLE
+        elif piece_type == PAWN:
+            if abs(to - frm) == 32:
+                move |= DOUBLE_PUSH
+            elif to == self.ep_square and (to & 7) != (frm & 7):
+                move |= EN_PASSANT
+            elif to >> 4 == 0 or to >> 4 == 7:
+                move |= PROMOTION_TYPES[promotion or 'queen'] << PROMOTION_SHIFT
+        return move
+
+    def _make(self, move):
+        """Apply a move to the 0x88 board in place and return the captured piece code."""
+        squares = self.squares
+        frm, to = move & 0x7F, (move >> 7) & 0x7F
+        piece = squares[frm]
+        captured = squares[to]
+        side = piece >> 3
+        own, enemy = self.piece_squares[side], self.piece_squares[side ^ 1]
+        promotion = (move >> PROMOTION_SHIFT) & 7
+        squares[to] = (piece & COLOR_MASK) | promotion if promotion else piece
+        squares[frm] = EMPTY
+        own.discard(frm)
+        own.add(to)
+        if captured:
+            enemy.discard(to)
+        if piece & TYPE_MASK == KING:
+            self.king_squares[side] = to
+
+        if move & EN_PASSANT:
+            # The captured pawn sits beside the moving pawn, not on the destination
+            captured_square = (frm & 0x70) | (to & 7)
+            captured = squares[captured_square]
+            squares[captured_square] = EMPTY
+            enemy.discard(captured_square)
+        elif move & CASTLE:
+            # Castling also moves the rook
+            rook_from, rook_to = (frm & 0x70) | (0 if to < frm else 7), (frm + to) >> 1
+            squares[rook_to] = squares[rook_from]
+            squares[rook_from] = EMPTY
+            own.discard(rook_from)
+            own.add(rook_to)
+
+        return captured
+
+    def _unmake(self, move, captured):
+        """Restore the 0x88 board from a move and the piece code returned by _make."""
+        squares = self.squares
+        frm, to = move & 0x7F, (move >> 7) & 0x7F
+        piece = squares[to]
+        side = piece >> 3
+        own, enemy = self.piece_squares[side], self.piece_squares[side ^ 1]
+        squares[frm] = (piece & COLOR_MASK) | PAWN if (move >> PROMOTION_SHIFT) & 7 else piece
+        own.discard(to)
+        own.add(frm)
+        if piece & TYPE_MASK == KING:
+            self.king_squares[side] = frm
+
+        if move & EN_PASSANT:
+            squares[to] = EMPTY
+            captured_square = (frm & 0x70) | (to & 7)
+            squares[captured_square] = captured
+            enemy.add(captured_square)
+        else:
+            squares[to] = captured
+            if captured:
+                enemy.add(to)
+            if move & CASTLE:
+                rook_from, rook_to = (frm & 0x70) | (0 if to < frm else 7), (frm + to) >> 1
+                squares[rook_from] = squares[rook_to]
+                squares[rook_to] = EMPTY
+                own.discard(rook_to)
+                own.add(rook_from)
+
+    def _leaves_king_in_check(self, move):
+        """Check if move would leave the mover's own king in check."""
+        color = self.squares[move & 0x7F] & COLOR_MASK
+        captured = self._make(move)
+        king_square = self._find_king(color)
+        in_check = king_square is not None and self._is_square_under_attack(king_square, color ^ COLOR_MASK)
+        self._unmake(move, captured)
+        return in_check
+
+    def _apply_move(self, move):
+        """Apply an encoded move and update turn, castling rights, en passant state, clocks and position key.
+
+        Returns the record _undo_move needs to take the move back.
+        """
+        squares = self.squares
+        frm, to = move & 0x7F, (move >> 7) & 0x7F
+        piece = squares[frm]
+        captured = self._make(move)
+        record = (captured, self.castling_rights, self.ep_square, self.halfmove_clock, self._key, self._fen)
+
+        key = self._key ^ ZOBRIST_PIECES[piece][frm] ^ ZOBRIST_PIECES[squares[to]][to] ^ ZOBRIST_WHITE_TO_MOVE
+        if captured:
+            key ^= ZOBRIST_PIECES[captured][(frm & 0x70) | (to & 7) if move & EN_PASSANT else to]
+        elif move & CASTLE:
+            rook = (piece & COLOR_MASK) | ROOK
+            key ^= ZOBRIST_PIECES[rook][(frm & 0x70) | (0 if to < frm else 7)] ^ ZOBRIST_PIECES[rook][(frm + to) >> 1]
+        # Moving from or capturing on a king or rook home square clears the matching rights
+        rights = self.castling_rights & CASTLING_MASK[frm] & CASTLING_MASK[to]
+        self._key = key ^ ZOBRIST_CASTLING[self.castling_rights] ^ ZOBRIST_CASTLING[rights]
+        self._fen = None
+
+        self.castling_rights = rights
+        self.ep_square = (frm + to) >> 1 if move & DOUBLE_PUSH else None
+        self.halfmove_clock = 0 if captured or piece & TYPE_MASK == PAWN else self.halfmove_clock + 1
+        if self.current_turn == 'black':
+            self.fullmove_number += 1
+        self.current_turn = 'black' if self.current_turn == 'white' else 'white'
+        return record
+
+    def _undo_move(self, move, record):
+        """Take back a move applied by _apply_move."""
+        captured, self.castling_rights, self.ep_square, self.halfmove_clock, self._key, self._fen = record
+        self._unmake(move, captured)
+        self.current_turn = 'black' if self.current_turn == 'white' else 'white'
+        if self.current_turn == 'black':
+            self.fullmove_number -= 1
+
+    def _is_in_check(self, color):
         """Check if the given color's king is in check."""
-        king_pos = self._find_king(board, color)
-        if not king_pos:
+        color_bits = COLOR_BITS[color]
+        king_square = self._find_king(color_bits)
+        if king_square is None:
             return False
-        
-        opponent_color = 'black' if color == 'white' else 'white'
-        return self._is_square_under_attack(king_pos[0], king_pos[1], opponent_color, board)
 
-    def _find_king(self, board, color):
-        """Find the position of the king of given color."""
-        king_symbol = '♔' if color == 'white' else '♚'
-        for row in range(8):
-            for col in range(8):
-                if board[row][col] == king_symbol:
-                    return row, col
-        return None
-
-    def _is_square_under_attack(self, row, col, attacking_color, board):
-        """Check if a square is under attack by any piece of the attacking color."""
-        for i in range(8):
-            for j in range(8):
-                piece = board[i][j]
-                if piece != ' ' and get_piece_color(piece) == attacking_color:
-                    if self._is_valid_attack_move(i, j, row, col, board):
-                        return True
-        return False
+        return self._is_square_under_attack(king_square, color_bits ^ COLOR_MASK)
+
+    def _find_king(self, color_bits):
+        """Get the 0x88 square of the king of given color (tracked incrementally, None if absent)."""
+        return self.king_squares[color_bits >> 3]
 
-    def _is_valid_attack_move(self, from_row, from_col, to_row, to_col, board):
-        """Check if a piece could theoretically move to attack a square."""
-        piece = board[from_row][from_col]
-        piece_type = get_piece_type(piece)
-        
-        if piece_type == 'pawn':
-            direction = -1 if get_piece_color(piece) == 'white' else 1
-            return to_row == from_row + direction and abs(to_col - from_col) == 1
-        elif piece_type == 'knight':
-            row_diff = abs(to_row - from_row)
-            col_diff = abs(to_col - from_col)
-            return (row_diff == 2 and col_diff == 1) or (row_diff == 1 and col_diff == 2)
-        elif piece_type == 'bishop':
-            return abs(to_row - from_row) == abs(to_col - from_col)
-        elif piece_type == 'rook':
-            return from_row == to_row or from_col == to_col
-        elif piece_type == 'queen':
-            return from_row == to_row or from_col == to_col or abs(to_row - from_row) == abs(to_col - from_col)
-        elif piece_type == 'king':
-            return abs(to_row - from_row) <= 1 and abs(to_col - from_col) <= 1
+    def _is_square_under_attack(self, target, attacker_bits):
+        """Check if a square is under attack by any piece of the attacking color.
+
+        Works backwards from the target: pawn, knight and king offsets, then the first piece on each ray.
+        """
+        squares = self.squares
+        # A pawn attacks target from where a pawn of the other color on target would capture
+        pawn = attacker_bits | PAWN
+        for square in PAWN_CAPTURES[(attacker_bits ^ COLOR_MASK) >> 3][target]:
+            if squares[square] == pawn:
+                return True
+        knight = attacker_bits | KNIGHT
+        for square in KNIGHT_TARGETS[target]:
+            if squares[square] == knight:
+                return True
+        king = attacker_bits | KING
+        for square in KING_TARGETS[target]:
+            if squares[square] == king:
+                return True
+
+        queen = attacker_bits | QUEEN
+        for rays, slider in ((BISHOP_RAYS, attacker_bits | BISHOP), (ROOK_RAYS, attacker_bits | ROOK)):
+            for ray in rays[target]:
+                for square in ray:
+                    piece = squares[square]
+                    if piece:
+                        if piece == slider or piece == queen:
+                            return True
+                        break
         return False
 
-    def make_move(self, from_row, from_col, to_row, to_col):
+    def make_move(self, from_row, from_col, to_row, to_col, promotion=None):
         """Make a move on the board and update game state."""
-        piece = self.board[from_row][from_col]
-        piece_type = get_piece_type(piece)
-        
-        is_castling = piece_type == 'king' and abs(to_col - from_col) == 2
-        
-        if is_castling:
-            rook_col = 0 if to_col < from_col else 7
-            new_rook_col = 3 if to_col < from_col else 5
-            rook = self.board[from_row][rook_col]
-            
-            # Move king
-            self.board[to_row][to_col] = piece
-            self.board[from_row][from_col] = ' '
-            # Move rook
-            self.board[from_row][new_rook_col] = rook
-            self.board[from_row][rook_col] = ' '
-            
-            # Update castling flags
-            self.king_moved[self.current_turn] = True
-            self.rook_moved[self.current_turn][0 if rook_col == 0 else 1] = True
-        else:
-            # Make normal move
-            self.board[to_row][to_col] = piece
-            self.board[from_row][from_col] = ' '
-            
-            # Update castling flags
-            if piece_type == 'king':
-                self.king_moved[self.current_turn] = True
-            elif piece_type == 'rook':
-                self.rook_moved[self.current_turn][0 if from_col == 0 else 1] = True
-        
-        # Switch turns
-        self.current_turn = 'black' if self.current_turn == 'white' else 'white'
+        move = self._encode_move(square_index(from_row, from_col), square_index(to_row, to_col), promotion)
+        self._push_move(move)
+        self.moves.append(move_to_uci(move))
+        self.version += 1
         self.is_player_turn = not self.is_player_turn
-        
+
         # Convert move to chess notation
         files = 'abcdefgh'
         ranks = '87654321'
         from_square = f'{files[from_col]}{ranks[from_row]}'
         to_square = f'{files[to_col]}{ranks[to_row]}'
-        
+
         return from_square, to_square
 
+    def undo_move(self):
+        """Take back the last move played and return it in UCI notation, or None if there is none."""
+        if not self.history:
+            return None
+        move, record = self.history.pop()
+        self.position_keys.pop()
+        self._undo_move(move, record)
+        self.moves.pop()
+        self.version += 1
+        self.is_player_turn = not self.is_player_turn
+        # The game cannot have been over before the move was played
+        self.game_over = False
+        self.winner = None
+        self.result = None
+        return move_to_uci(move)
+
+    def _push_move(self, move):
+        """Apply an encoded move and record it for undo_move and repetition detection."""
+        self.history.append((move, self._apply_move(move)))
+        self.position_keys.append(self.zobrist_key())
+
+    def encode_board(self):
+        """Pack the board into 64 bytes of piece codes, a8 first, for batch evaluation."""
+        squares = self.squares
+        return bytes([squares[square] for square in BOARD_SQUARES])
+
+    def changed_squares(self, before):
+        """List [row, col, glyph] for every square that differs from an earlier copy of self.squares."""
+        squares = self.squares
+        return [[square >> 4, square & 7, GLYPHS[squares[square]]]
+                for square in BOARD_SQUARES if squares[square] != before[square]]
+
+    def zobrist_key(self):
+        """Get the 64-bit Zobrist key of the position.
+
+        Like Polyglot, the en passant file only counts when a pawn can actually capture en passant.
+        """
+        if self.ep_square is not None and self._can_capture_en_passant():
+            return self._key ^ ZOBRIST_EP_FILE[self.ep_square & 7]
+        return self._key
+
+    def _can_capture_en_passant(self):
+        """Check whether a pawn of the side to move stands next to the en passant target."""
+        color = COLOR_BITS[self.current_turn]
+        pawn = color | PAWN
+        # Squares a pawn of the other color would attack from the target are where our capturing pawns stand
+        return any(self.squares[square] == pawn for square in PAWN_CAPTURES[(color ^ COLOR_MASK) >> 3][self.ep_square])
+
     def to_fen(self):
-        """Convert current board position to FEN notation."""
-        piece_to_fen = {
-            '♔': 'K', '♕': 'Q', '♖': 'R', '♗': 'B', '♘': 'N', '♙': 'P',
-            '♚': 'k', '♛': 'q', '♜': 'r', '♝': 'b', '♞': 'n', '♟': 'p',
-            ' ': '1'
-        }
-        
+        """Convert current board position to FEN notation (cached until the next move)."""
+        if self._fen is not None:
+            return self._fen
+        squares = self.squares
+
         # Convert board position
         fen_rows = []
-        for row in self.board:
+        for row in range(8):
             empty_count = 0
             fen_row = ''
-            
-            for piece in row:
-                if piece == ' ':
+
+            for col in range(8):
+                piece = squares[(row << 4) | col]
+                if piece == EMPTY:
                     empty_count += 1
                 else:
                     if empty_count > 0:
                         fen_row += str(empty_count)
                         empty_count = 0
-                    fen_row += piece_to_fen[piece]
-            
+                    fen_row += FEN_LETTERS[piece]
+
             if empty_count > 0:
                 fen_row += str(empty_count)
-            
+
             fen_rows.append(fen_row)
-        
+
         position = '/'.join(fen_rows)
-        
+
         # Add active color
         turn = 'w' if self.current_turn == 'white' else 'b'
-        
+
         # Add castling availability
-        castling_rights = []
-        
-        # White castling rights
-        if not self.king_moved['white']:
-            if not self.rook_moved['white'][1]:  # Kingside
-                castling_rights.append('K')
-            if not self.rook_moved['white'][0]:  # Queenside
-                castling_rights.append('Q')
-                
-        # Black castling rights
-        if not self.king_moved['black']:
-            if not self.rook_moved['black'][1]:  # Kingside
-                castling_rights.append('k')
-            if not self.rook_moved['black'][0]:  # Queenside
-                castling_rights.append('q')
-                
-        castling = ''.join(castling_rights) or '-'
-        
+        castling = ''.join(letter for right, letter in CASTLING_LETTERS if self.castling_rights & right) or '-'
+
+        # En passant target, only when a capture is possible so equal positions share one FEN
+        en_passant = '-'
+        if self.ep_square is not None and self._can_capture_en_passant():
+            en_passant = f"{'abcdefgh'[self.ep_square & 7]}{8 - (self.ep_square >> 4)}"
+
         # Combine all parts (position, active color, castling, en-passant, halfmove, fullmove)
-        return f"{position} {turn} {castling} - 0 1" 
\ No newline at end of file
+        self._fen = f"{position} {turn} {castling} {en_passant} {self.halfmove_clock} {self.fullmove_number}"
+        return self._fen
@@ -0,0 +1,133 @@
+"""Exact results and best moves for king and queen, rook or pawn against a lone king.
+
+build_bitbases.py writes one file per endgame: a bit-packed win/draw/loss table, two bits per position,
+followed by the distance to mate in plies, one byte per position, to pick the fastest win or the longest
+defence. Files are memory-mapped and probed in place.
+"""
+import mmap
+import os
+import struct
+
+from chess_logic import PAWN, ROOK, QUEEN, TYPE_MASK, COLOR_MASK, WHITE, BLACK, COLOR_BITS
+
+# File header: magic, format version, positions
+HEADER = struct.Struct('>4sHI')
+MAGIC = b'CGEB'
+FORMAT_VERSION = 1
+
+# Positions are indexed with the side that has the extra piece playing white, up the board
+ENDGAMES = {QUEEN: 'KQK', ROOK: 'KRK', PAWN: 'KPK'}
+POSITIONS = 2 * 64 * 64 * 64
+
+# Two-bit results for the side to move
+DRAW, WIN, LOSS, INVALID = 0, 1, 2, 3
+RESULT_NAMES = {DRAW: 'draw', WIN: 'win', LOSS: 'loss'}
+
+
+def table_index(to_move, strong_king, weak_king, piece):
+    """Index of a position: 0 when the side with the extra piece is to move, then squares as row * 8 + col."""
+    return ((to_move * 64 + strong_king) * 64 + weak_king) * 64 + piece
+
+
+def _square(square, flip):
+    square ^= flip
+    return (square >> 4) * 8 + (square & 7)
+
+
+def locate(game):
+    """Return (endgame name, table index) for a position the tables cover, or None."""
+    white, black = game.piece_squares
+    if len(white) + len(black) != 3 or game.castling_rights:
+        return None
+    strong = WHITE if len(white) == 2 else BLACK
+    king = game.king_squares[strong >> 3]
+    weak_king = game.king_squares[(strong ^ COLOR_MASK) >> 3]
+    piece = next(square for square in game.piece_squares[strong >> 3] if square != king)
+    name = ENDGAMES.get(game.squares[piece] & TYPE_MASK)
+    if name is None:
+        return None
+    # Mirror the ranks when black has the extra piece, so a black pawn also runs towards row 0
+    flip = 0x70 if strong == BLACK else 0
+    to_move = 0 if COLOR_BITS[game.current_turn] == strong else 1
+    return name, table_index(to_move, _square(king, flip), _square(weak_king, flip), _square(piece, flip))
+
+
+class EndgameTable:
+    """One memory-mapped endgame file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._distances = HEADER.size + POSITIONS // 4
+        if len(self._map) != self._distances + POSITIONS \
+                or HEADER.unpack_from(self._map) != (MAGIC, FORMAT_VERSION, POSITIONS):
+            self._map.close()
+            raise ValueError(f"{path} is not an endgame table of format {FORMAT_VERSION}")
+
+    def probe(self, index):
+        """Return (result, plies to mate) for the side to move at a table index."""
+        result = self._map[HEADER.size + (index >> 2)] >> ((index & 3) << 1) & 3
+        return result, self._map[self._distances + index]
+
+    def close(self):
+        self._map.close()
+
+
+class EndgameTables:
+    """The endgame files found in a directory, chosen by the material on the board."""
+
+    def __init__(self, directory):
+        self.tables = {}
+        for name in ENDGAMES.values():
+            path = os.path.join(directory, f"{name}.bin")
+            if os.path.exists(path):
+                self.tables[name] = EndgameTable(path)
+
+    def probe(self, game):
+        """Return ('win' | 'draw' | 'loss', plies to mate) for the side to move, or None when not covered."""
+        if game.is_insufficient_material():
+            return 'draw', 0
+        located = locate(game)
+        table = located and self.tables.get(located[0])
+        if not table:
+            return None
+        result, plies = table.probe(located[1])
+        return (RESULT_NAMES[result], plies) if result != INVALID else None
+
+    def best_move(self, game):
+        """Return (move, result, plies) for the fastest win, a move that holds the draw or the longest defence.
+
+        result and plies describe the position before the move; None when the position is not covered.
+        """
+        probed = self.probe(game)
+        if probed is None:
+            return None
+        best, best_score = None, None
+        for move in game.generate_legal_moves():
+            record = game._apply_move(move)
+            reply = self.probe(game)
+            game._undo_move(move, record)
+            if reply is None:
+                return None
+            # Scored for the mover: the opponent's loss is our win, and sooner is better
+            result, plies = reply
+            score = 1000 - plies if result == 'loss' else plies - 1000 if result == 'win' else 0
+            if best_score is None or score > best_score:
+                best, best_score = move, score
+        return (best, *probed) if best is not None else None
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+
+    def __len__(self):
+        return len(self.tables)
+
+
+def describe(result, plies):
+    """Human-readable verdict for the side to move."""
+    if result == 'draw':
+        return 'draw'
+    moves = (plies + 1) // 2
+    return f"mate in {moves}" if result == 'win' else f"mated in {moves}" if plies else 'checkmated'
@@ -0,0 +1,165 @@
+import random
+import threading
+import time
+
+from metrics import ERRORS, timed
+
+CHESS_API_URL = 'https://chess-api.com/v1'
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def parse_engine_response(data):
+    """Convert a chess-api.com response into the engine result dict, or None if it has no move."""
+    if 'move' not in data:
+        return None
+    move = data['move']
+    from_col = ord(move[0]) - ord('a')
+    from_row = 8 - int(move[1])
+    to_col = ord(move[2]) - ord('a')
+    to_row = 8 - int(move[3])
+    promotion = {'q': 'queen', 'r': 'rook', 'b': 'bishop', 'n': 'knight'}.get(move[4:5])
+    # The principal variation may start with the best move itself; the reply we expect comes after it
+    continuation = data.get('continuationArr') or []
+    if continuation[:1] == [move]:
+        continuation = continuation[1:]
+
+    return {
+        'text': data.get('text', 'No description available'),
+        'win_chance': data.get('winChance', None),
+        'mate': data.get('mate', None),
+        'coordinates': (from_row, from_col, to_row, to_col),
+        'promotion': promotion,
+        'ponder': continuation[0] if continuation else None
+    }
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single trial call through once the cool-down has passed."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """Check whether a call may go upstream right now."""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class EngineClient:
+    """chess-api.com client with connection pooling, per-call deadlines, retries and a circuit breaker."""
+
+    def __init__(self, url=CHESS_API_URL, depth=12, timeout=5.0, retries=2, backoff=0.25,
+                 pool_size=10, breaker=None):
+        self.url = url
+        self.depth = depth
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """One keep-alive pool shared by every request handler thread, created on the first call."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def get_move(self, fen, deadline=None):
+        """Ask the engine for the best move, giving up after `deadline` seconds (retries included).
+
+        Returns None straight away while the circuit breaker is open, and after exhausting retries.
+        """
+        if not self.breaker.allow():
+            return None
+        # Deferred with the session so importing the app stays cheap
+        import requests
+
+        end = time.monotonic() + (deadline if deadline is not None else self.timeout * (self.retries + 1))
+        last_error = None
+        for attempt in range(self.retries + 1):
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                with timed('engine_api'):
+                    response = self.session.post(
+                        self.url,
+                        json={'fen': fen, 'depth': self.depth, 'variants': 1},
+                        timeout=min(self.timeout, remaining)
+                    )
+                if response.status_code not in RETRYABLE_STATUS:
+                    response.raise_for_status()
+                    self.breaker.record_success()
+                    return parse_engine_response(response.json())
+                last_error = requests.HTTPError(f"{response.status_code} from engine API")
+            except requests.HTTPError as e:
+                # Client errors mean the request was bad, not that the upstream is unhealthy
+                self.breaker.record_success()
+                ERRORS.inc(component='engine_api')
+                print(f"Error getting AI move: {e}")
+                return None
+            except (requests.RequestException, ValueError) as e:
+                last_error = e
+            if attempt == self.retries:
+                break  # report the failure now, so the caller's fallback gets the time
+
+            # Exponential backoff with full jitter, never sleeping past the deadline
+            delay = random.uniform(0, self.backoff * (2 ** attempt))
+            time.sleep(max(0.0, min(delay, end - time.monotonic())))
+
+        self.breaker.record_failure()
+        ERRORS.inc(component='engine_api')
+        print(f"Error getting AI move: {last_error or 'deadline exceeded'}")
+        return None
+
+    async def get_move_async(self, fen, deadline=None):
+        """Async variant of get_move for batch jobs; runs the pooled request in a worker thread."""
+        import asyncio
+        return await asyncio.to_thread(self.get_move, fen, deadline)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
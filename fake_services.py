@@ -0,0 +1,219 @@
+"""Local stand-ins for chess-api.com and the Gemini API, for load tests and offline development.
+
+The fake engine answers with a random legal move for the posted FEN and the fake Gemini endpoint
+with canned commentary (a JSON array when the prompt asks for one, a few words at a time for streaming
+requests), each after a configurable delay and with a configurable error rate. Point the app at them with:
+
+    export ENGINE_API_URL=http://127.0.0.1:8701/v1
+    export GEMINI_API_ENDPOINT=http://127.0.0.1:8702
+    export GEMINI_API_KEY=fake
+
+Usage: python fake_services.py [--engine-latency lognormal:0.3,0.5] [--gemini-latency uniform:0.5,2]
+       [--engine-errors 0.01] [--gemini-errors 0.01] [--engine-responses canned.json]
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from chess_logic import ChessGame, move_to_uci
+
+DEFAULT_COMMENTARY = "A sound developing move that keeps the position balanced and prepares the next plans."
+# Status codes returned for injected errors, picked at random
+ERROR_STATUSES = (429, 500, 503)
+
+
+def parse_latency(spec):
+    """Build a delay sampler from 'fixed:S', 'uniform:LOW,HIGH', 'normal:MEAN,SD' or 'lognormal:MEDIAN,SIGMA'."""
+    kind, _, args = spec.partition(':')
+    try:
+        values = [float(value) for value in args.split(',')] if args else []
+        if kind == 'fixed' and len(values) == 1:
+            return lambda: values[0]
+        if kind == 'uniform' and len(values) == 2:
+            return lambda: random.uniform(*values)
+        if kind == 'normal' and len(values) == 2:
+            return lambda: max(0.0, random.gauss(*values))
+        if kind == 'lognormal' and len(values) == 2:
+            median, sigma = values
+            return lambda: median * random.lognormvariate(0, sigma)
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"Invalid latency {spec!r}")
+
+
+class FakeService:
+    """Latency, error injection and request counting shared by both fake servers."""
+
+    def __init__(self, latency=lambda: 0.0, error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def begin(self):
+        """Sleep for one latency sample; returns an error status to send, or None."""
+        time.sleep(self.latency())
+        failed = random.random() < self.error_rate
+        with self._lock:
+            self.requests += 1
+            self.errors += failed
+        return random.choice(ERROR_STATUSES) if failed else None
+
+
+class FakeEngine(FakeService):
+    """chess-api.com stand-in playing random legal moves, or canned responses keyed by FEN."""
+
+    def __init__(self, latency=lambda: 0.0, error_rate=0.0, responses=None):
+        super().__init__(latency, error_rate)
+        self.responses = responses or {}
+
+    def respond(self, body):
+        fen = body['fen']
+        canned = self.responses.get(fen) or self.responses.get(' '.join(fen.split()[:4]))
+        if canned:
+            return canned
+        game = ChessGame.from_fen(fen)
+        moves = game.generate_legal_moves()
+        if not moves:
+            return {'text': 'No legal moves', 'eval': 0}
+        move = random.choice(moves)
+        return {
+            'move': move_to_uci(move),
+            'text': f"Fake engine move {move_to_uci(move)} out of {len(moves)} legal moves",
+            'eval': round(random.uniform(-1, 1), 2),
+            'winChance': round(random.uniform(40, 60), 1),
+            'mate': None,
+            'depth': body.get('depth', 12)
+        }
+
+
+class FakeGemini(FakeService):
+    """generateContent and streamGenerateContent stand-in returning canned commentary."""
+
+    def __init__(self, latency=lambda: 0.0, error_rate=0.0, text=DEFAULT_COMMENTARY, chunk_delay=0.05):
+        super().__init__(latency, error_rate)
+        self.text = text
+        self.chunk_delay = chunk_delay
+
+    def respond(self, body):
+        prompt = ' '.join(part.get('text', '') for content in body.get('contents', [])
+                          for part in content.get('parts', []))
+        batch = re.search(r'JSON array of (\d+) strings', prompt)
+        text = json.dumps([self.text] * int(batch.group(1))) if batch else self.text
+        return {'candidates': [{
+            'content': {'parts': [{'text': text}], 'role': 'model'},
+            'finishReason': 'STOP',
+            'index': 0
+        }]}
+
+    def stream(self, body):
+        """Yield the commentary as streaming chunks of a few words, chunk_delay seconds apart."""
+        words = self.respond(body)['candidates'][0]['content']['parts'][0]['text'].split(' ')
+        for start in range(0, len(words), 3):
+            if start:
+                time.sleep(self.chunk_delay)
+            text = ' '.join(words[start:start + 3]) + (' ' if start + 3 < len(words) else '')
+            yield {'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}, 'index': 0}]}
+
+
+def _handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            except ValueError:
+                return self._send(400, {'error': 'invalid JSON'})
+            status = service.begin()
+            if status:
+                return self._send(status, {'error': {'code': status, 'message': 'Injected failure'}})
+            try:
+                if ':streamGenerateContent' in self.path and hasattr(service, 'stream'):
+                    return self._send_stream(service.stream(body))
+                self._send(200, service.respond(body))
+            except (KeyError, ValueError) as e:
+                self._send(400, {'error': str(e)})
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_stream(self, chunks):
+            # The REST transport reads one JSON array, element by element, off a chunked response
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self._write_chunk('[')
+            for index, chunk in enumerate(chunks):
+                self._write_chunk((',' if index else '') + json.dumps(chunk))
+            self._write_chunk(']')
+            self.wfile.write(b'0\r\n\r\n')
+
+        def _write_chunk(self, text):
+            data = text.encode()
+            self.wfile.write(f'{len(data):X}\r\n'.encode() + data + b'\r\n')
+            self.wfile.flush()
+
+        def log_message(self, format, *args):
+            pass  # one line per request would drown the load test output
+
+    return Handler
+
+
+def serve(service, host, port):
+    """Start a fake server on a background thread and return it."""
+    server = ThreadingHTTPServer((host, port), _handler(service))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run fake chess-api.com and Gemini servers.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--engine-port', type=int, default=8701)
+    parser.add_argument('--gemini-port', type=int, default=8702)
+    parser.add_argument('--engine-latency', type=parse_latency, default='lognormal:0.3,0.5',
+                        help="delay per engine request, e.g. 'fixed:0.2' or 'lognormal:0.3,0.5' (median, sigma)")
+    parser.add_argument('--gemini-latency', type=parse_latency, default='lognormal:1.0,0.4',
+                        help='delay per Gemini request')
+    parser.add_argument('--engine-errors', type=float, default=0.0, help='fraction of engine requests that fail')
+    parser.add_argument('--gemini-errors', type=float, default=0.0, help='fraction of Gemini requests that fail')
+    parser.add_argument('--engine-responses', help='JSON file mapping FENs to canned chess-api responses')
+    parser.add_argument('--commentary', default=DEFAULT_COMMENTARY, help='canned Gemini commentary')
+    parser.add_argument('--chunk-delay', type=float, default=0.05, help='seconds between streamed commentary chunks')
+    args = parser.parse_args()
+
+    responses = {}
+    if args.engine_responses:
+        with open(args.engine_responses) as f:
+            responses = json.load(f)
+    engine = FakeEngine(args.engine_latency, args.engine_errors, responses)
+    gemini = FakeGemini(args.gemini_latency, args.gemini_errors, args.commentary, args.chunk_delay)
+    servers = [serve(engine, args.host, args.engine_port), serve(gemini, args.host, args.gemini_port)]
+    print(f"Fake engine on http://{args.host}:{args.engine_port}/v1, "
+          f"fake Gemini on http://{args.host}:{args.gemini_port}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(10)
+            print(f"engine {engine.requests} requests ({engine.errors} failed), "
+                  f"gemini {gemini.requests} requests ({gemini.errors} failed)", file=sys.stderr)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+# How often (seconds) a store sweeps out idle games
+EVICTION_INTERVAL = 60.0
+
+
+class MemoryGameStore:
+    """Per-process game store; idle games are evicted least recently used first."""
+
+    def __init__(self, idle_timeout=3600.0):
+        self.idle_timeout = idle_timeout
+        self._games = OrderedDict()  # game_id -> (updated_at, state)
+        self._lock = threading.Lock()
+        self._last_eviction = time.time()
+
+    def get(self, game_id):
+        with self._lock:
+            entry = self._games.get(game_id)
+            if entry is None:
+                return None
+            self._games.move_to_end(game_id)
+            return entry[1]
+
+    def put(self, game_id, state):
+        now = time.time()
+        with self._lock:
+            self._games[game_id] = (now, state)
+            self._games.move_to_end(game_id)
+            if now - self._last_eviction >= EVICTION_INTERVAL:
+                self._last_eviction = now
+                self._evict_idle(now)
+
+    def delete(self, game_id):
+        with self._lock:
+            self._games.pop(game_id, None)
+
+    def _evict_idle(self, now):
+        # Oldest entries come first, so stop at the first game that is still active
+        while self._games:
+            game_id, (updated_at, _) = next(iter(self._games.items()))
+            if now - updated_at <= self.idle_timeout:
+                break
+            del self._games[game_id]
+
+    def __len__(self):
+        return len(self._games)
+
+
+class SQLiteGameStore:
+    """Game store in a SQLite file, shareable by several worker processes and surviving restarts."""
+
+    def __init__(self, path, idle_timeout=3600.0):
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self._last_eviction = 0.0
+        with closing(self._connect()) as db, db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS games '
+                       '(id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)')
+            db.execute('CREATE INDEX IF NOT EXISTS games_updated_at ON games (updated_at)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, game_id):
+        with closing(self._connect()) as db:
+            row = db.execute('SELECT state FROM games WHERE id = ?', (game_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, game_id, state):
+        now = time.time()
+        with closing(self._connect()) as db, db:
+            db.execute('INSERT OR REPLACE INTO games (id, state, updated_at) VALUES (?, ?, ?)',
+                       (game_id, json.dumps(state, separators=(',', ':')), now))
+            if now - self._last_eviction >= EVICTION_INTERVAL:
+                self._last_eviction = now
+                db.execute('DELETE FROM games WHERE updated_at < ?', (now - self.idle_timeout,))
+
+    def delete(self, game_id):
+        with closing(self._connect()) as db, db:
+            db.execute('DELETE FROM games WHERE id = ?', (game_id,))
+
+    def __len__(self):
+        with closing(self._connect()) as db:
+            return db.execute('SELECT COUNT(*) FROM games').fetchone()[0]
+
+
+def create_game_store(url, idle_timeout=3600.0):
+    """Build a game store from a URL: 'memory' or 'sqlite:///path/to/games.db'."""
+    if url == 'memory':
+        return MemoryGameStore(idle_timeout)
+    if url.startswith('sqlite:///'):
+        return SQLiteGameStore(url[len('sqlite:///'):], idle_timeout)
+    raise ValueError(f"Unsupported GAME_STORE: {url!r}")
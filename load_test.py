@@ -0,0 +1,151 @@
+"""Load generator playing many concurrent games against a running Chess GPT server.
+
+Each simulated player starts a game through /select_color, then plays random legal moves through
+/move until the game ends or reaches the move limit. Run it against the app wired to
+fake_services.py to measure worker and concurrency settings without touching the real APIs.
+
+Usage: python load_test.py [--url http://127.0.0.1:5000] [--games 50] [--concurrency 10] [--moves 20]
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from chess_logic import ChessGame, PIECE_CODES, TYPE_MASK, TYPE_NAMES, move_coords, move_promotion
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+class Stats:
+    """Thread-safe collection of per-request latencies and outcomes."""
+
+    def __init__(self):
+        self.latencies = {'select_color': [], 'move': []}
+        self.outcomes = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+
+    def count(self, outcome):
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+
+def _ai_promotion(data, to_row, to_col):
+    """Read the promoted piece of the AI's move off the squares the server sent back."""
+    if data.get('board'):
+        glyph = data['board'][to_row][to_col]
+    else:
+        glyph = next((glyph for row, col, glyph in data.get('changes', []) if (row, col) == (to_row, to_col)), ' ')
+    return TYPE_NAMES[PIECE_CODES.get(glyph, 0) & TYPE_MASK] if glyph != ' ' else None
+
+
+def play_game(url, color, max_moves, stats, timeout):
+    """Play one game; returns how it ended."""
+    session = requests.Session()
+    start = time.perf_counter()
+    response = session.get(f'{url}/select_color/{color}', timeout=timeout)
+    stats.record('select_color', time.perf_counter() - start)
+    if response.status_code != 200:
+        return 'error'
+
+    # Mirror the game locally so every move sent is legal; the AI's moves come back in the replies
+    game = ChessGame()
+    game.create_initial_board()
+    version = 0
+    if color == 'black':
+        # The server already played the AI's first move; pick it up from the full state
+        state = session.get(f'{url}/state', timeout=timeout).json()
+        for move in game.generate_legal_moves():
+            record = game._apply_move(move)
+            if game.board == state['board']:
+                break
+            game._undo_move(move, record)
+        version = state['version']
+
+    for _ in range(max_moves):
+        moves = game.generate_legal_moves()
+        if not moves:
+            return 'finished'
+        move = random.choice(moves)
+        from_row, from_col, to_row, to_col = move_coords(move)
+        start = time.perf_counter()
+        response = session.post(f'{url}/move', timeout=timeout, json={
+            'from_row': from_row, 'from_col': from_col, 'to_row': to_row, 'to_col': to_col,
+            'promotion': move_promotion(move), 'version': version
+        })
+        stats.record('move', time.perf_counter() - start)
+        if response.status_code != 200:
+            return 'error'
+        data = response.json()
+        if not data.get('valid'):
+            return 'rejected'
+        game.make_move(from_row, from_col, to_row, to_col, move_promotion(move))
+        version = data['version']
+        if data.get('game_over'):
+            return 'finished'
+        if not data.get('ai_move'):
+            return 'no_ai_move'
+        ai = data['ai_move']
+        ai_coords = (ai['from_row'], ai['from_col'], ai['to_row'], ai['to_col'])
+        game.make_move(*ai_coords, _ai_promotion(data, ai['to_row'], ai['to_col']))
+    return 'move_limit'
+
+
+def run(url, games, concurrency, max_moves, timeout):
+    stats = Stats()
+
+    def player(index):
+        color = 'white' if index % 2 == 0 else 'black'
+        try:
+            stats.count(play_game(url, color, max_moves, stats, timeout))
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f"Game {index} failed: {e}", file=sys.stderr)
+            stats.count('error')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(player, range(games)))
+    return stats, time.perf_counter() - start
+
+
+def report(stats, elapsed):
+    turns = stats.latencies['move']
+    print(f"{sum(stats.outcomes.values())} games in {elapsed:.1f}s: "
+          + ', '.join(f"{count} {outcome}" for outcome, count in sorted(stats.outcomes.items())))
+    print(f"throughput  {len(turns) / elapsed:.2f} turns/s")
+    for endpoint, values in stats.latencies.items():
+        if values:
+            print(f"{endpoint:<12} n={len(values):<6} p50={percentile(values, 0.5) * 1000:.0f}ms "
+                  f"p95={percentile(values, 0.95) * 1000:.0f}ms p99={percentile(values, 0.99) * 1000:.0f}ms "
+                  f"max={max(values) * 1000:.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play concurrent games against a Chess GPT server.')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='server base URL')
+    parser.add_argument('--games', type=int, default=50, help='games to play in total')
+    parser.add_argument('--concurrency', type=int, default=10, help='games played at the same time')
+    parser.add_argument('--moves', type=int, default=20, help='player moves per game at most')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds per request')
+    args = parser.parse_args()
+
+    stats, elapsed = run(args.url.rstrip('/'), args.games, args.concurrency, args.moves, args.timeout)
+    report(stats, elapsed)
+    return 0 if not stats.outcomes.get('error') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,371 @@
+import os
+import time
+from math import exp
+
+from chess_logic import (
+    ChessGame, BOARD_SQUARES, EMPTY, TYPE_MASK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, WHITE, BLACK,
+    EN_PASSANT, PROMOTION_SHIFT, move_coords, move_promotion, move_to_uci
+)
+from tables import load_tables
+
+# Wall-clock budget per move in seconds and the deepest iteration we will start
+LOCAL_ENGINE_TIME = float(os.environ.get('LOCAL_ENGINE_TIME', '1.0'))
+MAX_DEPTH = 64
+MAX_PLY = 128
+
+MATE_SCORE = 100000
+MATE_THRESHOLD = MATE_SCORE - MAX_PLY
+INFINITY = MATE_SCORE + 1
+
+TT_MAX_ENTRIES = 500000
+TT_EXACT, TT_LOWER, TT_UPPER = 0, 1, 2
+
+PIECE_VALUES = (0, 100, 320, 330, 500, 900, 20000)
+
+# Piece-square tables from white's point of view, index row * 8 + col with row 0 = rank 8
+PAWN_TABLE = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    5, 5, 10, 25, 25, 10, 5, 5,
+    0, 0, 0, 20, 20, 0, 0, 0,
+    5, -5, -10, 0, 0, -10, -5, 5,
+    5, 10, 10, -20, -20, 10, 10, 5,
+    0, 0, 0, 0, 0, 0, 0, 0,
+)
+KNIGHT_TABLE = (
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20, 0, 0, 0, 0, -20, -40,
+    -30, 0, 10, 15, 15, 10, 0, -30,
+    -30, 5, 15, 20, 20, 15, 5, -30,
+    -30, 0, 15, 20, 20, 15, 0, -30,
+    -30, 5, 10, 15, 15, 10, 5, -30,
+    -40, -20, 0, 5, 5, 0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+)
+BISHOP_TABLE = (
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 10, 10, 5, 0, -10,
+    -10, 5, 5, 10, 10, 5, 5, -10,
+    -10, 0, 10, 10, 10, 10, 0, -10,
+    -10, 10, 10, 10, 10, 10, 10, -10,
+    -10, 5, 0, 0, 0, 0, 5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20,
+)
+ROOK_TABLE = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    5, 10, 10, 10, 10, 10, 10, 5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    0, 0, 0, 5, 5, 0, 0, 0,
+)
+QUEEN_TABLE = (
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 5, 5, 5, 0, -10,
+    -5, 0, 5, 5, 5, 5, 0, -5,
+    0, 0, 5, 5, 5, 5, 0, -5,
+    -10, 5, 5, 5, 5, 5, 0, -10,
+    -10, 0, 5, 0, 0, 0, 0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20,
+)
+KING_TABLE = (
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    20, 20, 0, 0, 0, 0, 20, 20,
+    20, 30, 10, 0, 0, 10, 30, 20,
+)
+PIECE_TABLES = {PAWN: PAWN_TABLE, KNIGHT: KNIGHT_TABLE, BISHOP: BISHOP_TABLE,
+                ROOK: ROOK_TABLE, QUEEN: QUEEN_TABLE, KING: KING_TABLE}
+
+
+def _build_square_scores():
+    """Combine material and piece-square values into one signed score per (piece code, 0x88 square)."""
+    scores = [[0] * 128 for _ in range(16)]
+    for piece_type, table in PIECE_TABLES.items():
+        for square in BOARD_SQUARES:
+            row, col = square >> 4, square & 7
+            scores[WHITE | piece_type][square] = PIECE_VALUES[piece_type] + table[row * 8 + col]
+            # Black reads the table upside down and counts negatively
+            scores[BLACK | piece_type][square] = -(PIECE_VALUES[piece_type] + table[(7 - row) * 8 + col])
+    return scores
+
+
+SQUARE_SCORES = load_tables('local_engine', _build_square_scores)
+
+# Shared between searches so consecutive moves of a game reuse earlier work
+_transposition_table = {}
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the wall-clock budget runs out."""
+
+
+def evaluate(game):
+    """Static evaluation in centipawns from the side to move's point of view."""
+    squares = game.squares
+    score = 0
+    for pieces in game.piece_squares:
+        for square in pieces:
+            score += SQUARE_SCORES[squares[square]][square]
+    return score if game.current_turn == 'white' else -score
+
+
+class Searcher:
+    """Iterative-deepening alpha-beta search over a ChessGame with a wall-clock budget."""
+
+    def __init__(self, game, time_limit=LOCAL_ENGINE_TIME, max_depth=MAX_DEPTH, stop=None):
+        self.game = game
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.stop = stop  # optional threading.Event that ends the search early, as if time ran out
+        self.deadline = 0.0
+        self.nodes = 0
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = {}
+        if len(_transposition_table) > TT_MAX_ENTRIES:
+            _transposition_table.clear()
+        self.tt = _transposition_table
+
+    def search(self):
+        """Search the current position and return (best_move, score, depth) of the last completed iteration."""
+        game = self.game
+        self.deadline = time.perf_counter() + self.time_limit
+        root_moves = game.generate_legal_moves()
+        if not root_moves:
+            return None, (-MATE_SCORE if game._is_in_check(game.current_turn) else 0), 0
+
+        best_move, best_score, completed_depth = root_moves[0], 0, 0
+        root_moves = self._order_moves(root_moves, self._tt_move(), 0)
+        for depth in range(1, self.max_depth + 1):
+            try:
+                score, move = self._search_root(root_moves, depth)
+            except SearchTimeout:
+                break
+            best_move, best_score, completed_depth = move, score, depth
+
+            # Search the previous best move first at the next depth
+            root_moves.remove(move)
+            root_moves.insert(0, move)
+            if abs(score) >= MATE_THRESHOLD or len(root_moves) == 1:
+                break
+
+        return best_move, best_score, completed_depth
+
+    def _tt_move(self):
+        entry = self.tt.get(self.game.zobrist_key())
+        return entry[3] if entry else 0
+
+    def _check_time(self):
+        self.nodes += 1
+        if not self.nodes & 1023 and (time.perf_counter() > self.deadline
+                                      or self.stop is not None and self.stop.is_set()):
+            raise SearchTimeout
+
+    def _search_root(self, moves, depth):
+        game = self.game
+        alpha, beta = -INFINITY, INFINITY
+        best_move = moves[0]
+        for move in moves:
+            record = game._apply_move(move)
+            try:
+                score = -self._negamax(depth - 1, -beta, -alpha, 1)
+            finally:
+                game._undo_move(move, record)
+            if score > alpha:
+                alpha, best_move = score, move
+
+        self.tt[game.zobrist_key()] = (depth, alpha, TT_EXACT, best_move)
+        return alpha, best_move
+
+    def _negamax(self, depth, alpha, beta, ply):
+        self._check_time()
+        game = self.game
+        in_check = game._is_in_check(game.current_turn)
+        if in_check:
+            # Check extension: never drop into quiescence while in check
+            depth += 1
+        if depth <= 0 or ply >= MAX_PLY - 1:
+            return self._quiesce(alpha, beta, ply)
+
+        key = game.zobrist_key()
+        entry = self.tt.get(key)
+        tt_move = 0
+        if entry:
+            entry_depth, entry_score, entry_flag, tt_move = entry
+            if entry_depth >= depth:
+                entry_score = _score_from_tt(entry_score, ply)
+                if entry_flag == TT_EXACT:
+                    return entry_score
+                if entry_flag == TT_LOWER and entry_score >= beta:
+                    return entry_score
+                if entry_flag == TT_UPPER and entry_score <= alpha:
+                    return entry_score
+
+        original_alpha = alpha
+        mover = game.current_turn
+        squares = game.squares
+        best_score, best_move = -INFINITY, 0
+        legal_moves = 0
+        for move in self._order_moves(game.generate_pseudo_legal_moves(), tt_move, ply):
+            record = game._apply_move(move)
+            try:
+                if game._is_in_check(mover):
+                    continue
+                legal_moves += 1
+                score = -self._negamax(depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                game._undo_move(move, record)
+
+            if score > best_score:
+                best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if squares[(move >> 7) & 0x7F] == EMPTY and not move & EN_PASSANT:
+                            self._record_quiet_cutoff(move, depth, ply)
+                        break
+
+        if not legal_moves:
+            return -MATE_SCORE + ply if in_check else 0
+
+        if best_score <= original_alpha:
+            flag = TT_UPPER
+        elif best_score >= beta:
+            flag = TT_LOWER
+        else:
+            flag = TT_EXACT
+        self.tt[key] = (depth, _score_to_tt(best_score, ply), flag, best_move)
+        return best_score
+
+    def _quiesce(self, alpha, beta, ply):
+        """Resolve captures and promotions so the static evaluation is not taken mid-exchange."""
+        self._check_time()
+        game = self.game
+        stand_pat = evaluate(game)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        squares = game.squares
+        mover = game.current_turn
+        tactical = [move for move in game.generate_pseudo_legal_moves()
+                    if squares[(move >> 7) & 0x7F] != EMPTY or move & EN_PASSANT or (move >> PROMOTION_SHIFT) & 7]
+        for move in self._order_moves(tactical, 0, ply):
+            record = game._apply_move(move)
+            try:
+                if game._is_in_check(mover):
+                    continue
+                score = -self._quiesce(-beta, -alpha, ply + 1)
+            finally:
+                game._undo_move(move, record)
+
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _order_moves(self, moves, tt_move, ply):
+        """Sort moves: hash move, captures by MVV-LVA, promotions, killers, then history."""
+        squares = self.game.squares
+        killers = self.killers[ply] if ply < MAX_PLY else ()
+        history = self.history
+
+        def move_score(move):
+            if move == tt_move:
+                return 1000000
+            victim = squares[(move >> 7) & 0x7F] & TYPE_MASK
+            if victim or move & EN_PASSANT:
+                attacker = squares[move & 0x7F] & TYPE_MASK
+                return 100000 + (victim or PAWN) * 10 - attacker
+            promotion = (move >> PROMOTION_SHIFT) & 7
+            if promotion:
+                return 90000 + promotion
+            if move in killers:
+                return 80000
+            return history.get(move, 0)
+
+        return sorted(moves, key=move_score, reverse=True)
+
+    def _record_quiet_cutoff(self, move, depth, ply):
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[move] = min(self.history.get(move, 0) + depth * depth, 70000)
+
+
+def _score_to_tt(score, ply):
+    # Mate scores are stored relative to the node rather than the root
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def _score_from_tt(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+def win_chance(centipawns):
+    """Convert a centipawn score into a 0-100 winning chance (same curve as chess-api.com)."""
+    return 50 + 50 * (2 / (1 + exp(-0.00368208 * centipawns)) - 1)
+
+
+def get_local_move(fen, time_limit=LOCAL_ENGINE_TIME, stop=None):
+    """Search a FEN position in-process and return the same dict shape as the remote engine.
+
+    Setting stop ends the search early; it then returns None rather than a shallow result.
+    """
+    try:
+        game = ChessGame()
+        game.load_fen(fen)
+        searcher = Searcher(game, time_limit, stop=stop)
+        move, score, depth = searcher.search()
+    except Exception as e:
+        print(f"Error getting local engine move: {e}")
+        return None
+    if move is None or stop is not None and stop.is_set():
+        return None
+
+    # Report scores from white's point of view like chess-api.com
+    white_score = score if game.current_turn == 'white' else -score
+    mate = None
+    if abs(white_score) >= MATE_THRESHOLD:
+        moves_to_mate = (MATE_SCORE - abs(white_score) + 1) // 2
+        mate = moves_to_mate if white_score > 0 else -moves_to_mate
+        evaluation = f"mate in {moves_to_mate}"
+    else:
+        evaluation = f"{white_score / 100:+.2f}"
+
+    # The expected reply is the hash move of the position after ours, when the search got that far
+    game._apply_move(move)
+    entry = searcher.tt.get(game.zobrist_key())
+    ponder = move_to_uci(entry[3]) if entry and entry[3] else None
+
+    from_row, from_col, to_row, to_col = move_coords(move)
+    files, ranks = 'abcdefgh', '87654321'
+    return {
+        'text': f"Move {files[from_col]}{ranks[from_row]} → {files[to_col]}{ranks[to_row]}: [{evaluation}]. "
+                f"Depth {depth}, {searcher.nodes} nodes.",
+        'win_chance': win_chance(white_score) if mate is None else (100.0 if mate > 0 else 0.0),
+        'mate': mate,
+        'coordinates': (from_row, from_col, to_row, to_col),
+        'promotion': move_promotion(move),
+        'ponder': ponder
+    }
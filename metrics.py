@@ -0,0 +1,179 @@
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from move validation (sub-millisecond) up to slow Gemini calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(self.labelnames, key), value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """Latency histogram with cumulative buckets, in the Prometheus exposition layout."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[index] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._values.items()]
+        for key, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', _format_labels(self.labelnames, key, [('le', bound)]), cumulative))
+            samples.append((f'{self.name}_bucket', _format_labels(self.labelnames, key, [('le', '+Inf')]), entry[-1]))
+            samples.append((f'{self.name}_sum', _format_labels(self.labelnames, key), entry[-2]))
+            samples.append((f'{self.name}_count', _format_labels(self.labelnames, key), entry[-1]))
+        return samples
+
+
+class Registry:
+    """Collects metrics and callbacks and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def register_collector(self, collect):
+        """Add a callback returning (name, type, documentation, [(labels dict, value), ...]) tuples at scrape time."""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in metric.samples())
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+                continue
+            for name, metric_type, documentation, samples in families:
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Shared by the app, the engine client and the analysis code
+STAGE_SECONDS = Histogram('chess_gpt_stage_seconds', 'Latency of request stages and upstream calls.', ['stage'])
+ERRORS = Counter('chess_gpt_errors_total', 'Errors by component.', ['component'])
+
+
+@contextmanager
+def timed(stage, timings=None):
+    """Time a block into the stage histogram and, when given, a per-request timings dict."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if timings is not None:
+            timings[stage] = elapsed
+
+
+def track_future(future, stage, timings):
+    """Wrap a submitted future so its completion time lands in the timings dict before anyone sees the result."""
+    start = time.perf_counter()
+    tracked = Future()
+
+    def finish(done):
+        timings[stage] = time.perf_counter() - start
+        try:
+            if done.cancelled():
+                tracked.cancel()
+            elif done.exception():
+                tracked.set_exception(done.exception())
+            else:
+                tracked.set_result(done.result())
+        except InvalidStateError:
+            pass  # the caller already gave up on it
+
+    # Giving up on the tracked future also cancels the work if it has not started
+    tracked.add_done_callback(lambda result: result.cancelled() and future.cancel())
+    future.add_done_callback(finish)
+    return tracked
+
+
+def cache_collector(caches):
+    """Build a collector exporting the counters and sizes of named PositionCaches."""
+    def collect():
+        events, sizes = [], []
+        for name, cache in caches.items():
+            stats = cache.stats()
+            sizes.append(({'cache': name}, stats.pop('size')))
+            events.extend(({'cache': name, 'event': event}, count) for event, count in stats.items())
+        return [
+            ('chess_gpt_cache_events_total', 'counter', 'Cache lookups and evictions by outcome.', events),
+            ('chess_gpt_cache_entries', 'gauge', 'Entries held in memory by each cache.', sizes)
+        ]
+    return collect
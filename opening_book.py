@@ -0,0 +1,97 @@
+import mmap
+import os
+import random
+import struct
+
+from chess_logic import (
+    KING, ROOK, TYPE_MASK, COLOR_MASK, PROMOTION_SHIFT, CASTLE, TYPE_NAMES, square_index, square_coords
+)
+
+# Polyglot entry: key (u64), move (u16), weight (u16), learn (u32), big-endian, sorted by key
+ENTRY = struct.Struct('>QHHI')
+MAX_WEIGHT = 0xFFFF
+
+
+def _book_square(square):
+    """Convert a 0x88 square to a Polyglot square number (a1 = 0, h8 = 63)."""
+    return (7 - (square >> 4)) << 3 | (square & 7)
+
+
+def encode_book_move(move):
+    """Convert an encoded move to a Polyglot move (castling is written as king-takes-rook)."""
+    frm, to = move & 0x7F, (move >> 7) & 0x7F
+    if move & CASTLE:
+        to = (frm & 0x70) | (0 if to < frm else 7)
+    book_move = _book_square(to) | _book_square(frm) << 6
+    promotion = (move >> PROMOTION_SHIFT) & 7
+    if promotion:
+        # Polyglot numbers promotions knight = 1 ... queen = 4, one below our piece types
+        book_move |= (promotion - 1) << 12
+    return book_move
+
+
+def decode_book_move(game, book_move):
+    """Find the legal move in game matching a Polyglot move, or None."""
+    to = square_index(7 - ((book_move >> 3) & 7), book_move & 7)
+    frm = square_index(7 - ((book_move >> 9) & 7), (book_move >> 6) & 7)
+    promotion = (book_move >> 12) & 7
+    piece, target = game.squares[frm], game.squares[to]
+    if piece & TYPE_MASK == KING and target & TYPE_MASK == ROOK and target & COLOR_MASK == piece & COLOR_MASK:
+        # King takes its own rook: castle towards that rook
+        to = frm + (2 if to > frm else -2)
+    promotion = TYPE_NAMES[promotion + 1] if promotion else None
+    if not game.is_valid_move(*square_coords(frm), *square_coords(to), promotion):
+        return None
+    return game._encode_move(frm, to, promotion)
+
+
+class OpeningBook:
+    """Read-only, memory-mapped opening book in the Polyglot file layout.
+
+    Entries are keyed by this project's own Zobrist keys, not Polyglot's Random64 table, so a standard
+    Polyglot .bin loads but never matches a position; books must be built with build_book.py.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+        self.size = len(self._map) // ENTRY.size
+
+    def entries(self, key):
+        """Return the (book_move, weight) pairs stored for a Zobrist key."""
+        # Binary search for the first entry with this key
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if ENTRY.unpack_from(self._map, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < self.size:
+            entry_key, book_move, weight, _ = ENTRY.unpack_from(self._map, low * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((book_move, weight))
+            low += 1
+        return found
+
+    def choose(self, game, rng=random):
+        """Pick a book move for the game's position, weighted by the book weights; None when out of book."""
+        candidates = []
+        for book_move, weight in self.entries(game.zobrist_key()):
+            move = decode_book_move(game, book_move)
+            if move is not None and weight:
+                candidates.append((move, weight))
+        if not candidates:
+            return None
+        moves, weights = zip(*candidates)
+        return rng.choices(moves, weights)[0]
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+
+    def __len__(self):
+        return self.size
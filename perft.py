@@ -0,0 +1,181 @@
+"""Perft correctness and speed suite for chess_logic.
+
+Counts the leaf nodes of the legal move tree of standard reference positions, checks them against
+the published values and reports nodes per second against a saved baseline. Wrong counts fail the run;
+a slowdown only does with --strict, since timings on a shared machine are noisy.
+
+Usage: python perft.py [--deep] [--position NAME] [--divide] [--repeat N] [--strict] [--save-baseline]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from chess_logic import ChessGame, BOARD_SQUARES, square_coords, move_promotion, move_to_uci
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'perft_baseline.json')
+
+# (name, FEN, known node counts for depth 1, 2, ...) from the Chess Programming Wiki perft results
+POSITIONS = (
+    ('initial', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+     (20, 400, 8902, 197281, 4865609)),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     (48, 2039, 97862, 4085603)),
+    ('endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     (14, 191, 2812, 43238, 674624)),
+    ('promotions', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     (6, 264, 9467, 422333)),
+    ('tricky', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     (44, 1486, 62379, 2103487)),
+    ('middlegame', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     (46, 2079, 89890, 3894594)),
+)
+
+# Depths run by default (quick) and with --deep
+DEPTHS = {'initial': 4, 'kiwipete': 3, 'endgame': 4, 'promotions': 3, 'tricky': 3, 'middlegame': 3}
+DEEP_DEPTHS = {'initial': 5, 'kiwipete': 4, 'endgame': 5, 'promotions': 4, 'tricky': 4, 'middlegame': 4}
+
+# A position counts as a speed regression when it runs this much slower than the baseline
+MAX_SLOWDOWN = 0.25
+# Timed runs per position after one warmup; the fastest counts
+REPEATS = 3
+
+
+def perft(game, depth):
+    """Count the leaf nodes of the legal move tree to the given depth."""
+    moves = game.generate_legal_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        record = game._apply_move(move)
+        nodes += perft(game, depth - 1)
+        game._undo_move(move, record)
+    return nodes
+
+
+def divide(game, depth):
+    """Node counts below each root move, for tracking down a wrong total against another engine."""
+    counts = {}
+    for move in game.generate_legal_moves():
+        record = game._apply_move(move)
+        counts[move_to_uci(move)] = perft(game, depth - 1) if depth > 1 else 1
+        game._undo_move(move, record)
+    return counts
+
+
+def check_validation(game):
+    """Check that is_valid_move accepts exactly the generated legal moves; returns the mismatched moves."""
+    legal = {move_to_uci(move): move for move in game.generate_legal_moves()}
+    accepted = set()
+    for frm in BOARD_SQUARES:
+        for to in BOARD_SQUARES:
+            for promotion in (None, 'queen', 'knight'):
+                if game.is_valid_move(*square_coords(frm), *square_coords(to), promotion):
+                    accepted.add(move_to_uci(game._encode_move(frm, to, promotion)))
+    # Only the promotions tried above can be accepted, so leave the rook and bishop ones out
+    expected = {uci for uci, move in legal.items() if move_promotion(move) not in ('rook', 'bishop')}
+    return sorted(accepted ^ expected)
+
+
+def load_game(fen):
+    game = ChessGame()
+    game.load_fen(fen)
+    return game
+
+
+def timed_perft(game, depth, repeats):
+    """Return (nodes, fastest of repeats timed runs) after one shallower warmup run."""
+    perft(game, max(1, depth - 1))
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        nodes = perft(game, depth)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return nodes, best
+
+
+def run(positions, depths, baseline, repeats=REPEATS):
+    """Run every position, print a report and return (all counts correct, any speed regression)."""
+    correct, regressed, results = True, False, {}
+    total_nodes, total_time = 0, 0.0
+    for name, fen, expected in positions:
+        depth = depths[name]
+        game = load_game(fen)
+        mismatches = check_validation(game)
+
+        nodes, elapsed = timed_perft(game, depth, repeats)
+        nps = nodes / elapsed if elapsed else 0.0
+        total_nodes += nodes
+        total_time += elapsed
+        results[name] = {'depth': depth, 'nodes': nodes, 'nps': round(nps)}
+
+        status = 'ok' if nodes == expected[depth - 1] and not mismatches else 'FAIL'
+        correct = correct and status == 'ok'
+        line = f"{name:<11} depth {depth}  {nodes:>9} nodes  {elapsed:7.2f}s  {nps:>9.0f} nodes/s  {status}"
+        reference = baseline.get(name)
+        if reference and reference['depth'] == depth:
+            change = nps / reference['nps'] - 1
+            line += f"  ({change:+.0%} vs baseline)"
+            if change < -MAX_SLOWDOWN:
+                regressed = True
+                line += '  SLOWER'
+        print(line)
+        if nodes != expected[depth - 1]:
+            print(f"  expected {expected[depth - 1]} nodes")
+        if mismatches:
+            print(f"  is_valid_move disagrees with move generation on: {', '.join(mismatches)}")
+
+    if total_time:
+        print(f"total       {total_nodes:>18} nodes  {total_time:7.2f}s  {total_nodes / total_time:>9.0f} nodes/s")
+    return correct, regressed, results
+
+
+def load_baseline(path=BASELINE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check chess_logic move generation against reference perft counts.')
+    parser.add_argument('--deep', action='store_true', help='search one ply deeper (slower)')
+    parser.add_argument('--position', choices=[name for name, _, _ in POSITIONS], help='run a single position')
+    parser.add_argument('--depth', type=int, help='override the depth')
+    parser.add_argument('--divide', action='store_true', help='print node counts per root move')
+    parser.add_argument('--repeat', type=int, default=REPEATS, help='timed runs per position, the fastest counts')
+    parser.add_argument('--strict', action='store_true', help='also exit non-zero on a speed regression')
+    parser.add_argument('--save-baseline', action='store_true', help='record this run as the speed baseline')
+    args = parser.parse_args()
+
+    positions = [position for position in POSITIONS if args.position in (None, position[0])]
+    depths = dict(DEEP_DEPTHS if args.deep else DEPTHS)
+    if args.depth:
+        depths.update((name, min(args.depth, len(expected))) for name, _, expected in positions)
+
+    if args.divide:
+        for name, fen, _ in positions:
+            print(name)
+            for uci, nodes in sorted(divide(load_game(fen), depths[name]).items()):
+                print(f"  {uci}: {nodes}")
+        return 0
+
+    baseline = load_baseline()
+    correct, regressed, results = run(positions, depths, baseline, max(1, args.repeat))
+    if args.save_baseline:
+        if not correct:
+            print("Not saving a baseline from a run with wrong node counts")
+            return 1
+        baseline.update(results)
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {BASELINE_PATH}")
+    return 0 if correct and not (args.strict and regressed) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import re
+
+from chess_logic import (
+    ChessGame, KING, QUEEN, ROOK, BISHOP, KNIGHT, PAWN, TYPE_MASK, CASTLE, PROMOTION_SHIFT, square_index
+)
+
+SAN_PIECES = {'K': KING, 'Q': QUEEN, 'R': ROOK, 'B': BISHOP, 'N': KNIGHT}
+SAN_PATTERN = re.compile(r'^([KQRBN])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([QRBN]))?$')
+HEADER_PATTERN = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+# Movetext tokens: comments, variation brackets, NAGs, move numbers, results and SAN moves
+TOKEN_PATTERN = re.compile(r'\{[^}]*\}|;[^\n]*|\(|\)|\$\d+|\d+\.+|1-0|0-1|1/2-1/2|\*|[^\s(){};]+')
+
+
+def read_games(lines):
+    """Stream games from an iterable of PGN lines, yielding (headers, san_moves) one game at a time.
+
+    Comments, NAGs and variations are skipped, so memory stays proportional to a single game.
+    """
+    headers, movetext = {}, []
+    for line in lines:
+        line = line.strip()
+        match = HEADER_PATTERN.match(line)
+        if match:
+            if movetext:
+                yield headers, _parse_movetext(' '.join(movetext))
+                headers, movetext = {}, []
+            headers[match.group(1)] = match.group(2)
+        elif line:
+            movetext.append(line)
+            if line.split()[-1] in RESULTS:
+                yield headers, _parse_movetext(' '.join(movetext))
+                headers, movetext = {}, []
+    if movetext or headers:
+        yield headers, _parse_movetext(' '.join(movetext))
+
+
+def _parse_movetext(text):
+    """Extract the main-line SAN moves from PGN movetext."""
+    moves = []
+    depth = 0
+    for token in TOKEN_PATTERN.findall(text):
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth or token[0] in '{;$' or token[0].isdigit() and token.rstrip('.').isdigit() or token in RESULTS:
+            continue
+        else:
+            moves.append(token)
+    return moves
+
+
+def san_to_move(game, san):
+    """Resolve a SAN move such as 'Nbd7', 'exd5', 'O-O' or 'e8=Q+' to an encoded legal move."""
+    san = san.rstrip('+#!?')
+    legal_moves = game.generate_legal_moves()
+
+    if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        queen_side = len(san) == 5
+        for move in legal_moves:
+            if move & CASTLE and (((move >> 7) & 7) < (move & 7)) == queen_side:
+                return move
+        raise ValueError(f"Illegal move: {san}")
+
+    match = SAN_PATTERN.match(san)
+    if not match:
+        raise ValueError(f"Unreadable move: {san}")
+    piece, from_file, from_rank, target, promotion = match.groups()
+    piece_type = SAN_PIECES[piece] if piece else PAWN
+    to = square_index(8 - int(target[1]), 'abcdefgh'.index(target[0]))
+    promotion_type = SAN_PIECES[promotion] if promotion else 0
+
+    squares = game.squares
+    candidates = [
+        move for move in legal_moves
+        if (move >> 7) & 0x7F == to
+        and squares[move & 0x7F] & TYPE_MASK == piece_type
+        and (move >> PROMOTION_SHIFT) & 7 == promotion_type
+        and (from_file is None or move & 7 == 'abcdefgh'.index(from_file))
+        and (from_rank is None or (move & 0x7F) >> 4 == 8 - int(from_rank))
+    ]
+    if len(candidates) != 1:
+        raise ValueError(f"{'Ambiguous' if candidates else 'Illegal'} move: {san}")
+    return candidates[0]
+
+
+def replay(san_moves, start_fen=None):
+    """Replay SAN moves from the start (or a FEN), yielding (game, move) before each move is applied."""
+    game = ChessGame()
+    if start_fen:
+        game.load_fen(start_fen)
+    else:
+        game.create_initial_board()
+    for san in san_moves:
+        move = san_to_move(game, san)
+        yield game, move
+        game._apply_move(move)
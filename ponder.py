@@ -0,0 +1,131 @@
+"""Background pondering: search the AI's replies to the player's likely moves while the player thinks.
+
+Results land in the engine (and optionally commentary) caches, so a correctly predicted /move is
+answered from the cache, or joins the search already in flight.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from chess_logic import ChessGame, move_coords, move_to_uci
+from metrics import Counter
+
+PREDICTIONS = Counter('chess_gpt_ponder_predictions_total', 'Player moves that were or were not pondered.', ['outcome'])
+JOBS = Counter('chess_gpt_ponder_jobs_total', 'Pondering searches by how they ended.', ['state'])
+
+
+def predict_moves(game, count, hint=None):
+    """Guess the side to move's likeliest moves: the engine's expected reply first, then by a one-ply evaluation."""
+    # NumPy is only loaded once pondering starts, not on every cold start
+    from batch_eval import evaluate_batch
+    moves = game.generate_legal_moves()
+    boards = []
+    for move in moves:
+        record = game._apply_move(move)
+        boards.append(game.encode_board())
+        game._undo_move(move, record)
+    # Scores are from white's point of view
+    sign = 1 if game.current_turn == 'white' else -1
+    scored = sorted(zip((sign * evaluate_batch(boards)).tolist(), moves), key=lambda item: item[0], reverse=True)
+    moves = [move for _, move in scored]
+    hinted = [move for move in moves if move_to_uci(move) == hint]
+    return (hinted + [move for move in moves if move not in hinted])[:count]
+
+
+class Ponderer:
+    """Runs pondering searches on a bounded pool, one set of predictions per game."""
+
+    def __init__(self, search, comment=None, workers=2, candidates=3, max_games=1000):
+        self.search = search  # (fen, stop event) -> engine result, filling the engine cache
+        self.comment = comment  # optional: list of analysis requests -> commentary, filling the commentary cache
+        self.candidates = candidates
+        self.max_games = max_games
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ponder')
+        self._sessions = {}  # game id -> {'jobs': {Zobrist key: (future, stop event)}, 'cancelled': bool}
+        self._lock = threading.Lock()
+
+    def start(self, game_id, fen, hint=None):
+        """Start pondering the player's moves from fen, replacing anything still running for the game."""
+        self.stop(game_id)
+        session = {'jobs': {}, 'cancelled': False}
+        with self._lock:
+            self._sessions[game_id] = session
+            # Abandoned games never call stop(); drop the oldest once there are too many
+            while len(self._sessions) > self.max_games:
+                self._cancel(self._sessions.pop(next(iter(self._sessions))))
+        self._executor.submit(self._plan, session, fen, hint)
+
+    def stop(self, game_id, key=None):
+        """Stop pondering for a game when the player's move arrives; returns whether the position was pondered.
+
+        key is the Zobrist key of the position after the player's move.
+        """
+        with self._lock:
+            session = self._sessions.pop(game_id, None)
+            if session is None:
+                return False
+            hit = key is not None and key in session['jobs']
+            # Keep the predicted position's search: the request may be waiting on it
+            self._cancel(session, keep=key if hit else None)
+        if key is not None:
+            PREDICTIONS.inc(outcome='hit' if hit else 'miss')
+        return hit
+
+    def _cancel(self, session, keep=None):
+        session['cancelled'] = True
+        cancelled = 0
+        for key, (future, stop) in session['jobs'].items():
+            if key != keep:
+                # Searches already running give up at their next time check
+                stop.set()
+                cancelled += future.cancel()
+        if cancelled:
+            JOBS.inc(cancelled, state='cancelled')
+
+    def _plan(self, session, fen, hint):
+        try:
+            game = ChessGame.from_fen(fen)
+            for move in predict_moves(game, self.candidates, hint):
+                board = game.board
+                from_row, from_col, to_row, to_col = move_coords(move)
+                is_capture = board[to_row][to_col] != ' '
+                record = game._apply_move(move)
+                request = dict(board=board, from_row=from_row, from_col=from_col, to_row=to_row, to_col=to_col,
+                               is_capture=is_capture, is_check=game._is_in_check(game.current_turn))
+                after, after_key = game.to_fen(), game.zobrist_key()
+                game._undo_move(move, record)
+                with self._lock:
+                    if session['cancelled']:
+                        return
+                    try:
+                        stop = threading.Event()
+                        session['jobs'][after_key] = self._executor.submit(self._ponder, after, request, stop), stop
+                    except RuntimeError:
+                        return  # the process is shutting down
+        except Exception as e:
+            print(f"Error planning ponder searches: {e}")
+
+    def _ponder(self, fen, request, stop):
+        try:
+            result = self.search(fen, stop)
+            if stop.is_set():
+                JOBS.inc(state='stopped')
+                return
+            if result and self.comment:
+                self.comment(self._analysis_requests(fen, request, result))
+            JOBS.inc(state='completed')
+        except Exception as e:
+            JOBS.inc(state='failed')
+            print(f"Error pondering {fen}: {e}")
+
+    @staticmethod
+    def _analysis_requests(fen, request, result):
+        """Commentary requests for the predicted move and the AI's reply, shaped as /move builds them."""
+        game = ChessGame.from_fen(fen)
+        ai_from_row, ai_from_col, ai_to_row, ai_to_col = result['coordinates']
+        board = game.board
+        is_capture = game.piece_at(ai_to_row, ai_to_col) != ' '
+        game.make_move(ai_from_row, ai_from_col, ai_to_row, ai_to_col, result.get('promotion'))
+        return [dict(request, engine_analysis=result), dict(
+            board=board, from_row=ai_from_row, from_col=ai_from_col, to_row=ai_to_row, to_col=ai_to_col,
+            is_capture=is_capture, is_check=game._is_in_check(game.current_turn), engine_analysis=result
+        )]
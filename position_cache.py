@@ -0,0 +1,196 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import closing
+
+# How many disk writes happen between checks of the on-disk size bound
+DISK_TRIM_INTERVAL = 100
+
+def normalize_fen(fen):
+    """Reduce a FEN to the fields that identify a position (placement, turn, castling, en passant)."""
+    return ' '.join(fen.split()[:4])
+
+
+class ComputeAborted(Exception):
+    """Raised by a compute function that gave up; callers waiting on it compute the value themselves."""
+
+
+class PositionCache:
+    """Thread-safe LRU cache with TTL, optional SQLite persistence and coalescing of concurrent misses."""
+
+    def __init__(self, max_entries=10000, ttl=None, path=None, max_disk_entries=None):
+        self.max_entries = max_entries
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self._disk_writes = 0
+        self._entries = OrderedDict()  # key -> (stored_at, value), least recently used first
+        self._pending = {}  # key -> Future of the computation in flight
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self.expirations = 0
+        if path:
+            with closing(self._connect()) as db, db:
+                db.execute('CREATE TABLE IF NOT EXISTS cache '
+                           '(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _is_expired(self, stored_at, now):
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def _get_memory(self, key, now):
+        """Look a key up in memory; the caller must hold the lock."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._is_expired(entry[0], now):
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _put_memory(self, key, value, stored_at):
+        """Insert a key in memory, evicting the least recently used entries; the caller must hold the lock."""
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _get_disk(self, key, now):
+        if not self.path:
+            return None
+        try:
+            with closing(self._connect()) as db:
+                row = db.execute('SELECT value, stored_at FROM cache WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading position cache: {e}")
+            return None
+        if row is None or self._is_expired(row[1], now):
+            return None
+        with self._lock:
+            self._put_memory(key, json.loads(row[0]), row[1])
+        return json.loads(row[0])
+
+    def _put_disk(self, key, value, stored_at):
+        if not self.path:
+            return
+        try:
+            with closing(self._connect()) as db, db:
+                db.execute('INSERT OR REPLACE INTO cache (key, value, stored_at) VALUES (?, ?, ?)',
+                           (key, json.dumps(value), stored_at))
+                self._disk_writes += 1
+                if self.max_disk_entries and self._disk_writes % DISK_TRIM_INTERVAL == 0:
+                    self._trim_disk(db)
+        except sqlite3.Error as e:
+            print(f"Error writing position cache: {e}")
+
+    def _trim_disk(self, db):
+        """Delete the oldest rows so the file holds at most max_disk_entries entries."""
+        excess = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.max_disk_entries
+        if excess > 0:
+            db.execute('DELETE FROM cache WHERE key IN '
+                       '(SELECT key FROM cache ORDER BY stored_at LIMIT ?)', (excess,))
+            with self._lock:
+                self.disk_evictions += excess
+
+    def get(self, key):
+        """Return the cached value for key, or None."""
+        now = time.time()
+        with self._lock:
+            value = self._get_memory(key, now)
+            if value is not None:
+                self.hits += 1
+                return value
+        value = self._get_disk(key, now)
+        with self._lock:
+            if value is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+        return value
+
+    def put(self, key, value):
+        """Store a value in memory and, when configured, on disk."""
+        now = time.time()
+        with self._lock:
+            self._put_memory(key, value, now)
+        self._put_disk(key, value, now)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, calling compute() at most once for concurrent misses.
+
+        None results are handed to every waiting caller but never stored. When compute() raises
+        ComputeAborted, only its own caller sees it: the waiters start over and compute the value themselves.
+        """
+        while True:
+            now = time.time()
+            with self._lock:
+                value = self._get_memory(key, now)
+                if value is not None:
+                    self.hits += 1
+                    return value
+                future = self._pending.get(key)
+                is_leader = future is None
+                if is_leader:
+                    future = self._pending[key] = Future()
+                else:
+                    self.coalesced += 1
+
+            if not is_leader:
+                try:
+                    return future.result()
+                except ComputeAborted:
+                    continue
+            break
+
+        try:
+            value = self._get_disk(key, now)
+            if value is not None:
+                with self._lock:
+                    self.disk_hits += 1
+            else:
+                with self._lock:
+                    self.misses += 1
+                value = compute()
+                if value is not None:
+                    self.put(key, value)
+        except BaseException as e:
+            self._finish(key, future, exception=e)
+            raise
+        self._finish(key, future, value)
+        return value
+
+    def _finish(self, key, future, value=None, exception=None):
+        # Unregister first, so waiters that start over never find the finished future again
+        with self._lock:
+            del self._pending[key]
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(value)
+
+    def stats(self):
+        """Return the hit/miss counters and current size."""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'disk_evictions': self.disk_evictions,
+                'expirations': self.expirations
+            }
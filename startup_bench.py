@@ -0,0 +1,74 @@
+"""Cold-start benchmark: time fresh interpreters importing the app and serving their first requests.
+
+Usage: python startup_bench.py [--runs 10] [--path /select_color/white] [--profile]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Runs inside each fresh interpreter and prints its timings as JSON
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+status = client.get(sys.argv[1]).status_code
+served = time.perf_counter()
+print(json.dumps({'import': imported - start, 'first_request': served - imported, 'status': status}))
+"""
+
+
+def measure(path, env):
+    """Start one interpreter and return its timings, with the whole process wall time as 'process'."""
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', PROBE, path], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings['process'] = time.perf_counter() - start
+    return timings
+
+
+def profile(env, top=15):
+    """Print the slowest imports of one cold start, by cumulative time."""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                rows.append((int(cumulative), name.rstrip()))
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:8.1f}ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the cold-start time of the app.')
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters to start')
+    parser.add_argument('--path', default='/health', help='first request to serve')
+    parser.add_argument('--profile', action='store_true', help='also list the slowest imports')
+    args = parser.parse_args()
+
+    # A placeholder key is enough: nothing talks to Gemini during startup
+    env = dict(os.environ)
+    env.setdefault('GEMINI_API_KEY', 'startup-benchmark')
+    runs = [measure(args.path, env) for _ in range(args.runs)]
+    print(f"{args.runs} cold starts, first request GET {args.path} -> {runs[0]['status']}")
+    for stage in ('process', 'import', 'first_request'):
+        values = [run[stage] * 1000 for run in runs]
+        print(f"{stage:<14} median {statistics.median(values):7.1f}ms  min {min(values):7.1f}ms  max {max(values):7.1f}ms")
+    if args.profile:
+        print()
+        profile(env)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,7 +4,10 @@ const gameState = {
     selectedSquare: null,
     isGameOver: false,
     canPlayerMove: true,
-    playerColor: document.querySelector('.chess-board').dataset.playerColor
+    playerColor: document.querySelector('.chess-board').dataset.playerColor,
+    version: parseInt(document.querySelector('.chess-board').dataset.version) || 0,
+    legalMoves: null,  // "row,col" of each movable piece -> Set of "row,col" destinations; null when unknown
+    analysisStream: null
 };
 
 // Constants 
@@ -47,6 +50,25 @@ const utils = {
         return utils.getPieceType(fromPiece.textContent) === 'king' && Math.abs(toCol - fromCol) === 2;
     },
     
+    // Index [fromRow, fromCol, toRow, toCol] pairs by origin square
+    indexLegalMoves(pairs) {
+        if (!Array.isArray(pairs)) return null;
+        const index = new Map();
+        pairs.forEach(([fromRow, fromCol, toRow, toCol]) => {
+            const key = `${fromRow},${fromCol}`;
+            if (!index.has(key)) index.set(key, new Set());
+            index.get(key).add(`${toRow},${toCol}`);
+        });
+        return index;
+    },
+    
+    // Is the move in the server's legal move list (moves are left to the server when the list is unknown)
+    isLegalMove(fromRow, fromCol, toRow, toCol) {
+        if (!gameState.legalMoves) return true;
+        const targets = gameState.legalMoves.get(`${fromRow},${fromCol}`);
+        return Boolean(targets && targets.has(`${toRow},${toCol}`));
+    },
+    
     // Check if path is clear (for castling)
     isPathClear(row, fromCol, toCol) {
         const step = fromCol < toCol ? 1 : -1;
@@ -107,26 +129,124 @@ const ui = {
         container.style.display = 'block';
     },
     
+    // Select a piece and highlight where it can go
+    selectSquare(square) {
+        gameState.selectedPiece = square.querySelector('.piece');
+        gameState.selectedSquare = square;
+        square.classList.add('selected');
+        
+        const targets = gameState.legalMoves && gameState.legalMoves.get(`${square.dataset.row},${square.dataset.col}`);
+        (targets || []).forEach(target => {
+            const [row, col] = target.split(',');
+            document.querySelector(`.square[data-row="${row}"][data-col="${col}"]`).classList.add('legal-target');
+        });
+    },
+    
+    // Open the server-sent event stream of a turn's commentary and append each chunk as it arrives
+    streamAnalysis(url, hasAiMove) {
+        if (gameState.analysisStream) {
+            gameState.analysisStream.close();
+        }
+        const panels = {
+            player: document.getElementById('analysis-content'),
+            ai: document.getElementById('ai-analysis-content')
+        };
+        panels.player.textContent = '';
+        panels.ai.textContent = '';
+        document.getElementById('ai-analysis').style.display = hasAiMove ? 'block' : 'none';
+        document.getElementById('analysis-container').style.display = 'block';
+        
+        const source = new EventSource(url);
+        gameState.analysisStream = source;
+        source.addEventListener('commentary', e => {
+            const chunk = JSON.parse(e.data);
+            panels[chunk.move].textContent += chunk.text;
+        });
+        // Close on completion so the browser does not reconnect and replay the stream
+        source.addEventListener('end', () => source.close());
+        source.onerror = () => source.close();
+    },
+    
     // Clear selection state
     clearSelection() {
         if (gameState.selectedSquare) {
             gameState.selectedSquare.classList.remove('selected');
         }
+        document.querySelectorAll('.legal-target').forEach(square => square.classList.remove('legal-target'));
         gameState.selectedPiece = null;
         gameState.selectedSquare = null;
     },
     
+    // Replace the legal move list sent by the server
+    setLegalMoves(pairs) {
+        gameState.legalMoves = utils.indexLegalMoves(pairs);
+    },
+    
+    // Fill the evaluation bar with white's share, given a centipawn score from white's point of view
+    setEvaluation(centipawns, label) {
+        const bar = document.getElementById('eval-bar');
+        document.getElementById('eval-bar-fill').style.width = `${100 / (1 + Math.exp(-centipawns / 400))}%`;
+        bar.title = label || `${centipawns >= 0 ? '+' : ''}${(centipawns / 100).toFixed(2)}`;
+    },
+    
     // Update game over state
     setGameOver(data) {
         const turnIndicator = document.getElementById('turn-indicator');
         gameState.isGameOver = true;
-        turnIndicator.textContent = `${data.winner} wins!`;
+        turnIndicator.textContent = data.winner ? `${data.winner} wins!` : 'Draw!';
+        ui.setEvaluation({ white: Infinity, black: -Infinity }[data.winner] || 0, turnIndicator.textContent);
         turnIndicator.classList.add('game-over');
         turnIndicator.classList.remove('in-check');
         ui.showStatus(data.message, true);
         document.getElementById('new-game-btn').disabled = true;
     },
     
+    // Leave the game over state after a takeback
+    clearGameOver() {
+        gameState.isGameOver = false;
+        document.getElementById('turn-indicator').classList.remove('game-over');
+        document.getElementById('new-game-btn').disabled = false;
+    },
+    
+    // Sync every square with the server board (covers promotions and en passant captures)
+    renderBoard(board) {
+        document.querySelectorAll('.square').forEach(square => {
+            square.querySelector('.piece').textContent = board[square.dataset.row][square.dataset.col];
+        });
+    },
+    
+    // Apply the squares that changed during a turn, as [row, col, piece] triples
+    applyChanges(changes) {
+        changes.forEach(([row, col, piece]) => {
+            document.querySelector(`.square[data-row="${row}"][data-col="${col}"] .piece`).textContent = piece;
+        });
+    },
+    
+    // Apply a move response: a delta when we were in sync, otherwise the full board
+    syncBoard(data) {
+        gameState.version = data.version;
+        if (data.board) {
+            ui.renderBoard(data.board);
+        } else if (data.changes) {
+            ui.applyChanges(data.changes);
+        }
+    },
+    
+    // Fetch the full state from the server after losing track of it
+    resync() {
+        fetch('/state')
+            .then(response => response.ok ? response.json() : null)
+            .then(data => {
+                if (data) {
+                    ui.syncBoard(data);
+                    ui.setLegalMoves(data.legal_moves);
+                    ui.setEvaluation(data.evaluation);
+                    ui.updateTurnIndicator(data.current_turn, data.in_check);
+                }
+            })
+            .catch(error => console.error('Error:', error));
+    },
+    
     // Update turn indicator
     updateTurnIndicator(currentTurn, inCheck) {
         const turnIndicator = document.getElementById('turn-indicator');
@@ -244,6 +364,12 @@ const moveHandler = {
             return;
         }
         
+        // Reject illegal moves locally instead of round-tripping to the server
+        if (!utils.isLegalMove(fromRow, fromCol, toRow, toCol)) {
+            ui.showStatus('Invalid move! Please check piece movement rules.', false);
+            return;
+        }
+        
         const originalFromContent = fromPiece.textContent;
         const originalToContent = toPiece.textContent;
         const isCastling = utils.isCastlingAttempt(fromPiece, fromCol, toCol);
@@ -304,7 +430,9 @@ const moveHandler = {
         fetch('/move', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ from_row: fromRow, from_col: fromCol, to_row: toRow, to_col: toCol })
+            body: JSON.stringify({
+                from_row: fromRow, from_col: fromCol, to_row: toRow, to_col: toCol, version: gameState.version
+            })
         })
         .then(response => response.json())
         .then(data => {
@@ -313,8 +441,13 @@ const moveHandler = {
             gameState.canPlayerMove = true;
 
             if (data.valid) {
-                // Display move analysis if available
-                if (data.move_analysis) {
+                ui.setLegalMoves(data.legal_moves);
+                ui.setEvaluation(data.evaluation);
+                
+                // Display move analysis if available, or stream it in when the server sends it separately
+                if (data.analysis_stream) {
+                    ui.streamAnalysis(data.analysis_stream, Boolean(data.ai_move));
+                } else if (data.move_analysis) {
                     ui.showAnalysis(data.move_analysis, data.ai_move_analysis);
                 }
 
@@ -323,13 +456,18 @@ const moveHandler = {
                     setTimeout(() => animations.animateMove(data.castling_info), 300);
                 }
                 
+                // Handle AI's move
+                if (data.ai_move) {
+                    animations.animateMove(data.ai_move, true);
+                }
+                
+                // Sync the board once all animations have finished
+                setTimeout(() => ui.syncBoard(data), ANIMATION.DURATION * 3);
+                
                 if (data.game_over) {
                     // Handle game over state
                     ui.setGameOver(data);
                 } else if (data.ai_move) {
-                    // Handle AI's move
-                    animations.animateMove(data.ai_move, true);
-                    
                     // Update turn indicator and check status
                     ui.updateTurnIndicator(data.current_turn, data.in_check);
                     
@@ -351,6 +489,8 @@ const moveHandler = {
             this.revertMove(isCastling, castlingState, fromPiece, toPiece, originalFromContent, originalToContent);
             console.error('Error:', error);
             ui.showStatus('Error making move!', false);
+            // The server may have applied the move anyway, so fetch its board
+            ui.resync();
         });
     },
     
@@ -417,9 +557,7 @@ const eventHandlers = {
             }
 
             // Select the piece
-            gameState.selectedPiece = clickedPiece;
-            gameState.selectedSquare = clickedSquare;
-            gameState.selectedSquare.classList.add('selected');
+            ui.selectSquare(clickedSquare);
         } 
         // Second click - Moving the piece or reselecting
         else {
@@ -438,9 +576,7 @@ const eventHandlers = {
                 // If clicking another piece of the same color, reselect it
                 if (clickedPieceColor === selectedPieceColor) {
                     ui.clearSelection();
-                    gameState.selectedPiece = clickedPiece;
-                    gameState.selectedSquare = clickedSquare;
-                    gameState.selectedSquare.classList.add('selected');
+                    ui.selectSquare(clickedSquare);
                     return;
                 }
             }
@@ -467,9 +603,7 @@ const eventHandlers = {
         }
 
         e.target.classList.add('dragging');
-        gameState.selectedPiece = e.target;
-        gameState.selectedSquare = e.target.parentElement;
-        gameState.selectedSquare.classList.add('selected');
+        ui.selectSquare(e.target.parentElement);
     },
     
     // Handle drag end
@@ -514,6 +648,33 @@ const eventHandlers = {
         ui.clearSelection();
     },
     
+    // Take back the player's last move and the AI's reply
+    takeBack() {
+        if (!gameState.canPlayerMove) {
+            return;
+        }
+        fetch('/takeback', { method: 'POST' })
+            .then(response => response.json())
+            .then(data => {
+                if (!data.valid) {
+                    ui.showStatus(data.message, false);
+                    return;
+                }
+                ui.clearSelection();
+                ui.syncBoard(data);
+                ui.setLegalMoves(data.legal_moves);
+                ui.setEvaluation(data.evaluation);
+                ui.clearGameOver();
+                ui.updateTurnIndicator(data.current_turn, data.in_check);
+                ui.showStatus(data.message, true);
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                ui.showStatus('Error taking back move!', false);
+                ui.resync();
+            });
+    },
+    
     // Start new game
     startNewGame() {
         if (!gameState.isGameOver && !confirm('Are you sure you want to start a new game?')) {
@@ -525,6 +686,8 @@ const eventHandlers = {
 
 // Initialize game
 document.getElementById('new-game-btn').disabled = gameState.isGameOver;
+ui.setLegalMoves(JSON.parse(document.querySelector('.chess-board').dataset.legalMoves || 'null'));
+ui.setEvaluation(parseInt(document.getElementById('eval-bar').dataset.evaluation) || 0);
 
 // Set up event listeners
 document.querySelectorAll('.square').forEach(square => {
@@ -538,5 +701,6 @@ document.querySelectorAll('.piece').forEach(piece => {
     piece.addEventListener('dragend', eventHandlers.handleDragEnd);
 });
 
-// Assign the startNewGame to global scope to be used by HTML button
+// Assign the button handlers to global scope to be used by HTML buttons
 window.startNewGame = eventHandlers.startNewGame;
+window.takeBack = eventHandlers.takeBack;
@@ -0,0 +1,87 @@
+"""Precomputed lookup tables shipped as a serialized artifact, so cold starts load them instead of building them.
+
+chess_logic and local_engine get their tables through load_tables(), which falls back to the builder
+when the artifact is missing or was written from different builder sources: the artifact records a
+hash of the modules that define the builders, so any edit to them makes it stale until it is rewritten.
+
+Usage: python tables.py [--check]
+"""
+import argparse
+import hashlib
+import marshal
+import os
+import sys
+import zlib
+
+TABLES_PATH = os.environ.get(
+    'CHESS_TABLES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chess_tables.bin')
+)
+# Modules defining the table builders, next to this file
+BUILDER_MODULES = ('chess_logic', 'local_engine')
+
+_sections = None
+
+
+def source_digest():
+    """Hash the source of the builder modules; None when it cannot be read."""
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        for module in BUILDER_MODULES:
+            with open(os.path.join(directory, f"{module}.py"), 'rb') as f:
+                digest.update(f.read())
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def _read_sections():
+    global _sections
+    if _sections is None:
+        try:
+            with open(TABLES_PATH, 'rb') as f:
+                artifact = marshal.loads(zlib.decompress(f.read()))
+            digest = source_digest()
+            _sections = artifact['sections'] if digest and artifact.get('source') == digest else {}
+        except (OSError, EOFError, ValueError, TypeError, KeyError, AttributeError, zlib.error):
+            _sections = {}
+    return _sections
+
+
+def load_tables(section, build):
+    """Return a section's tables from the artifact, or build() them when the artifact cannot supply them."""
+    tables = _read_sections().get(section)
+    return build() if tables is None else tables
+
+
+def build_sections():
+    """Run every table builder."""
+    import chess_logic
+    import local_engine
+    return {
+        'chess_logic': chess_logic._build_tables(),
+        'local_engine': local_engine._build_square_scores()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the precomputed tables artifact.')
+    parser.add_argument('--check', action='store_true', help='only verify that the artifact matches the builders')
+    args = parser.parse_args()
+
+    sections = build_sections()
+    if args.check:
+        if _read_sections() != sections:
+            print(f"{TABLES_PATH} is missing or out of date; run python tables.py")
+            return 1
+        print(f"{TABLES_PATH} is up to date")
+        return 0
+    data = zlib.compress(marshal.dumps({'source': source_digest(), 'sections': sections}), 9)
+    with open(TABLES_PATH, 'wb') as f:
+        f.write(data)
+    print(f"Wrote {len(data)} bytes to {TABLES_PATH}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ai_engine
+from chess_logic import ChessGame
+from position_cache import PositionCache
+
+
+class DrawnTables:
+    """Endgame tables that call every position a draw."""
+
+    def probe(self, game):
+        return 'draw', 0
+
+
+def test_adjudicated_draw_survives_save_and_reload(monkeypatch):
+    monkeypatch.setattr(ai_engine, '_endgame_tables', DrawnTables())
+    game = ChessGame()
+    game.create_initial_board()
+    game.player_color = 'white'
+    game.make_move(6, 4, 4, 4)
+    assert ai_engine.adjudicate_endgame(game)
+
+    reloaded = ChessGame.from_state(game.to_state())
+    assert reloaded.game_over
+    assert reloaded.result == 'endgame tables'
+    assert reloaded.winner is None
+
+
+def test_live_game_reloads_live():
+    game = ChessGame()
+    game.create_initial_board()
+    game.player_color = 'white'
+    game.make_move(6, 4, 4, 4)
+
+    reloaded = ChessGame.from_state(game.to_state())
+    assert not reloaded.game_over
+    assert reloaded.result is None
+
+
+def test_request_joining_a_stopped_ponder_search_still_gets_a_move(monkeypatch):
+    monkeypatch.setattr(ai_engine, 'ENGINE_MODE', 'local')
+    monkeypatch.setattr(ai_engine, 'engine_cache', PositionCache())
+    fen = 'r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 3 3'
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        pondering = executor.submit(ai_engine.precompute_ai_move, fen, stop)
+        while not ai_engine.engine_cache.misses:
+            time.sleep(0.01)
+        request = executor.submit(ai_engine.get_ai_move, fen)
+        while not ai_engine.engine_cache.coalesced:
+            time.sleep(0.01)
+        stop.set()
+        assert pondering.result() is None
+        assert request.result() is not None
@@ -0,0 +1,36 @@
+import pytest
+
+from chess_logic import ChessGame
+
+
+@pytest.mark.parametrize('fen', [
+    'k7/8/8/8/8/8/8/p3K3 b - - 0 1',  # pawn on the first rank
+    'P3k3/8/8/8/8/8/8/4K3 w - - 0 1',  # pawn on the eighth rank
+    '8/8/8/8/8/8/8/8 w - - 0 1',  # no kings
+    'k7/8/8/8/8/8/8/4K2K w - - 0 1',  # two white kings
+    '8/8/8/8/8/8/8/4K3 w - - 0 1',  # no black king
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq e3 0 1',  # en passant square for the side to move
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq e6 0 1',  # no pawn that just pushed two squares
+    'rnbqkbnr/pppppppp/8/4p3/8/8/PPPPPPPP/RNBQKBNR w KQkq e6 0 1',  # the pawn's start square is occupied
+])
+def test_from_fen_rejects_impossible_positions(fen):
+    with pytest.raises(ValueError):
+        ChessGame.from_fen(fen)
+
+
+def test_from_fen_accepts_legal_position():
+    game = ChessGame.from_fen('k7/8/8/8/8/8/p7/4K3 b - - 0 1')
+    assert not game.game_over
+
+
+@pytest.mark.parametrize('promotion, valid', [
+    (None, True), ('queen', True), ('knight', True), ('king', False), ('pawn', False), ('', False)
+])
+def test_is_valid_move_checks_promotion_piece(promotion, valid):
+    game = ChessGame.from_fen('k7/4P3/8/8/8/8/8/4K3 w - - 0 1')
+    assert game.is_valid_move(1, 4, 0, 4, promotion) is valid
+
+
+def test_from_fen_accepts_en_passant_after_double_push():
+    game = ChessGame.from_fen('rnbqkbnr/pppp1ppp/8/3Pp3/8/8/PPP1PPPP/RNBQKBNR w KQkq e6 0 3')
+    assert game.is_valid_move(3, 3, 2, 4)
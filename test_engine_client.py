@@ -0,0 +1,21 @@
+import time
+
+import engine_client
+from engine_client import EngineClient, CircuitBreaker
+from fake_services import FakeEngine, serve
+
+
+def test_failing_call_returns_without_a_final_backoff(monkeypatch):
+    # Every request fails; jitter always picks the longest delay
+    server = serve(FakeEngine(error_rate=1.0), '127.0.0.1', 0)
+    monkeypatch.setattr(engine_client.random, 'uniform', lambda low, high: high)
+    client = EngineClient(url=f'http://127.0.0.1:{server.server_port}/v1', retries=1, backoff=0.5,
+                          breaker=CircuitBreaker())
+    try:
+        start = time.monotonic()
+        assert client.get_move('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1') is None
+        # One backoff of 0.5s between the two attempts, none after the last
+        assert time.monotonic() - start < 0.9
+    finally:
+        client.close()
+        server.shutdown()